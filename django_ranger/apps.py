@@ -0,0 +1,18 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
+
+
+class RangerConfig(AppConfig):
+    name = 'django_ranger'
+    verbose_name = 'Django Ranger'
+    default_auto_field = 'django.db.models.AutoField'
+
+    def ready(self):
+        from . import cache, registry
+        from .models import Permission
+
+        post_save.connect(registry.clear_permissions, sender=Permission, dispatch_uid='django_ranger.registry.save')
+        post_delete.connect(registry.clear_permissions, sender=Permission, dispatch_uid='django_ranger.registry.delete')
+        if cache.is_enabled():
+            cache.connect_signals()
+        registry.autodiscover()
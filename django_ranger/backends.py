@@ -0,0 +1,308 @@
+"""
+Storage backends of the grants used by PermissionManager.
+
+The backend is chosen by the RANGER_GRANT_BACKEND setting, the dotted path of
+its class, and defaults to the ORM one. The in-memory backend keeps the grants
+of the users and groups in the process, with the same semantics, for tests or
+services without the database. The permissions are read from the registry
+in both cases, which builds them from their declarations when no database
+is configured.
+"""
+import json
+from threading import RLock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from . import cache as grant_cache
+from .models import Permission, UserGrant, GroupGrant
+from .parameters import EMPTY_PARAMETERS_HASH, hash_parameters
+from .registry import get_permission
+
+DEFAULT_BACKEND = 'django_ranger.backends.ORMGrantBackend'
+
+_backends = {}
+
+
+def get_backend():
+    """
+    Returns the grant backend of the RANGER_GRANT_BACKEND setting, instantiated once per process.
+    """
+    path = getattr(settings, 'RANGER_GRANT_BACKEND', DEFAULT_BACKEND)
+    backend = _backends.get(path)
+    if backend is None:
+        backend = _backends.setdefault(path, import_string(path)())
+    return backend
+
+
+def _insert_user_grant(user, permission, parameter_values, using):
+    """
+    Creates an UserGrant in a single statement, unless the same grant or the
+    grant without parameters of the permission already exists.
+    """
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    sql = (
+        "INSERT INTO {table} ({user}, {permission}, {parameter_values}, {parameters_hash}) "
+        "SELECT %s, %s, %s::jsonb, %s "
+        "WHERE NOT EXISTS ("
+        "SELECT 1 FROM {table} WHERE {user} = %s AND {permission} = %s AND {parameters_hash} = %s"
+        ") ON CONFLICT DO NOTHING"
+    ).format(
+        table=quote_name(UserGrant._meta.db_table),
+        user=quote_name(UserGrant._meta.get_field('user').column),
+        permission=quote_name(UserGrant._meta.get_field('permission').column),
+        parameter_values=quote_name(UserGrant._meta.get_field('parameter_values').column),
+        parameters_hash=quote_name(UserGrant._meta.get_field('parameters_hash').column),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [
+            user.pk, permission.pk, json.dumps(parameter_values), hash_parameters(parameter_values),
+            user.pk, permission.pk, EMPTY_PARAMETERS_HASH,
+        ])
+
+
+def _delete_user_grant(user, permission, parameter_values, using):
+    """
+    Deletes an UserGrant in a single statement, and returns the number of deleted grants.
+    """
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    sql = (
+        "DELETE FROM {table} "
+        "WHERE {user} = %s AND {permission} = %s AND {parameters_hash} = %s "
+        "RETURNING {id}"
+    ).format(
+        table=quote_name(UserGrant._meta.db_table),
+        id=quote_name(UserGrant._meta.pk.column),
+        user=quote_name(UserGrant._meta.get_field('user').column),
+        permission=quote_name(UserGrant._meta.get_field('permission').column),
+        parameters_hash=quote_name(UserGrant._meta.get_field('parameters_hash').column),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user.pk, permission.pk, hash_parameters(parameter_values)])
+        return len(cursor.fetchall())
+
+
+def _select_effective_grants(user_ids, using, scope=None, code=None):
+    """
+    Returns the (user_id, code, parameter_values, parameters_hash, source) of
+    the grants of the users and their groups in a single statement, optionally
+    restricted to the permissions of a scope or code. A grant given both ways
+    to a user is returned once, as a user grant.
+    """
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    groups_field = get_user_model()._meta.get_field('groups')
+    filters = [(name, value) for name, value in (('scope', scope), ('code', code)) if value is not None]
+    conditions = ['{}.{} = %s'.format(quote_name(Permission._meta.db_table), quote_name(Permission._meta.get_field(name).column))
+                  for name, value in filters]
+    sql = (
+        "SELECT DISTINCT ON (grants.user_id, grants.permission_id, grants.parameters_hash) "
+        "grants.user_id, {permission_table}.{code}, grants.parameter_values, grants.parameters_hash, grants.source "
+        "FROM ("
+        "SELECT {user} AS user_id, {user_permission} AS permission_id, {user_values} AS parameter_values, "
+        "{user_hash} AS parameters_hash, 'user' AS source "
+        "FROM {user_table} WHERE {user} = ANY(%s) "
+        "UNION ALL "
+        "SELECT {membership_table}.{membership_user}, {group_table}.{group_permission}, "
+        "{group_table}.{group_values}, {group_table}.{group_hash}, 'group' "
+        "FROM {group_table} INNER JOIN {membership_table} "
+        "ON {membership_table}.{membership_group} = {group_table}.{group} "
+        "WHERE {membership_table}.{membership_user} = ANY(%s)"
+        ") grants "
+        "INNER JOIN {permission_table} ON {permission_table}.{permission_id} = grants.permission_id "
+        "{where}"
+        "ORDER BY grants.user_id, grants.permission_id, grants.parameters_hash, grants.source DESC"
+    ).format(
+        permission_table=quote_name(Permission._meta.db_table),
+        permission_id=quote_name(Permission._meta.pk.column),
+        code=quote_name(Permission._meta.get_field('code').column),
+        where='WHERE %s ' % ' AND '.join(conditions) if conditions else '',
+        user_table=quote_name(UserGrant._meta.db_table),
+        user=quote_name(UserGrant._meta.get_field('user').column),
+        user_permission=quote_name(UserGrant._meta.get_field('permission').column),
+        user_values=quote_name(UserGrant._meta.get_field('parameter_values').column),
+        user_hash=quote_name(UserGrant._meta.get_field('parameters_hash').column),
+        group_table=quote_name(GroupGrant._meta.db_table),
+        group=quote_name(GroupGrant._meta.get_field('group').column),
+        group_permission=quote_name(GroupGrant._meta.get_field('permission').column),
+        group_values=quote_name(GroupGrant._meta.get_field('parameter_values').column),
+        group_hash=quote_name(GroupGrant._meta.get_field('parameters_hash').column),
+        membership_table=quote_name(groups_field.m2m_db_table()),
+        membership_user=quote_name(groups_field.m2m_column_name()),
+        membership_group=quote_name(groups_field.m2m_reverse_name()),
+    )
+    user_ids = list(user_ids)
+    params = [user_ids, user_ids] + [value for name, value in filters]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        # jsonb values are not decoded by the connection, as JSONField does it
+        return [(user_id, code, json.loads(values), parameters_hash, source)
+                for user_id, code, values, parameters_hash, source in cursor.fetchall()]
+
+
+class BaseGrantBackend(object):
+    """
+    The interface of the grant backends. Parameter values are given
+    normalized, and grants are returned as (code, parameter_values,
+    parameters_hash, source) rows, where source is 'user' or 'group'.
+    """
+
+    def load_grants(self, user, using, scope=None, code=None):
+        """
+        Returns the grants of the user and their groups, optionally restricted
+        to the permissions of a scope or code. A grant given both ways is
+        returned once, as a user grant.
+        """
+        raise NotImplementedError
+
+    def load_many_grants(self, user_ids, using):
+        """
+        Returns a dict of the given user ids and their grants, as `load_grants`
+        does. Backends may override it to load them in fewer queries.
+        """
+        users = get_user_model()._default_manager.using(using).filter(pk__in=user_ids)
+        return {user.pk: self.load_grants(user, using) for user in users}
+
+    def grant(self, user, permission, parameter_values, using):
+        """
+        Grants the permission to the user, unless the same grant or the grant
+        without parameters of the permission already exists.
+        """
+        raise NotImplementedError
+
+    def revoke(self, user, permission, parameter_values, using):
+        """
+        Revokes the given grant of the user, and returns the number of revoked grants.
+        """
+        raise NotImplementedError
+
+    def get_user_ids(self, permission, parameter_values, using):
+        """
+        Returns the set of ids of the users granted the permission with the
+        given parameter values, or without parameters, directly or through
+        their groups.
+        """
+        raise NotImplementedError
+
+
+class ORMGrantBackend(BaseGrantBackend):
+    """
+    Stores the grants in the UserGrant and GroupGrant models.
+    """
+
+    def load_grants(self, user, using, scope=None, code=None):
+        return [row[1:] for row in _select_effective_grants([user.pk], using, scope=scope, code=code)]
+
+    def load_many_grants(self, user_ids, using):
+        grants_by_user = {user_id: [] for user_id in user_ids}
+        for row in _select_effective_grants(user_ids, using):
+            grants_by_user[row[0]].append(row[1:])
+        return grants_by_user
+
+    def grant(self, user, permission, parameter_values, using):
+        _insert_user_grant(user, permission, parameter_values, using)
+
+    def revoke(self, user, permission, parameter_values, using):
+        return _delete_user_grant(user, permission, parameter_values, using)
+
+    def get_user_ids(self, permission, parameter_values, using):
+        hashes = {EMPTY_PARAMETERS_HASH, hash_parameters(parameter_values)}
+        user_ids = set(UserGrant.objects.using(using).filter(
+            permission=permission, parameters_hash__in=hashes,
+        ).values_list('user_id', flat=True))
+        user_ids.update(get_user_model().objects.using(using).filter(
+            groups__group_grants__permission=permission, groups__group_grants__parameters_hash__in=hashes,
+        ).values_list('pk', flat=True))
+        return user_ids
+
+
+class InMemoryGrantBackend(BaseGrantBackend):
+    """
+    Stores the grants of users and groups, and the group memberships, in
+    memory. It is safe to use from several threads.
+
+    Group grants and memberships are only known to this backend, so they are
+    managed with `grant_group`, `revoke_group`, `add_to_group` and `remove_from_group`.
+    """
+
+    def __init__(self):
+        self._lock = RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            # user id or group id -> {(code, parameters_hash): parameter_values}
+            self._user_grants = {}
+            self._group_grants = {}
+            # user id -> set of group ids
+            self._memberships = {}
+
+    def load_grants(self, user, using, scope=None, code=None):
+        with self._lock:
+            grants = {}
+            for group_id in self._memberships.get(user.pk, ()):
+                for key, parameter_values in self._group_grants.get(group_id, {}).items():
+                    grants[key] = (parameter_values, 'group')
+            for key, parameter_values in self._user_grants.get(user.pk, {}).items():
+                grants[key] = (parameter_values, 'user')
+
+        rows = []
+        for (grant_code, parameters_hash), (parameter_values, source) in grants.items():
+            if code is not None and grant_code != code:
+                continue
+            if scope is not None and get_permission(grant_code).scope != scope:
+                continue
+            rows.append((grant_code, dict(parameter_values), parameters_hash, source))
+        return rows
+
+    def grant(self, user, permission, parameter_values, using):
+        self._add(self._user_grants, user.pk, permission, parameter_values)
+
+    def revoke(self, user, permission, parameter_values, using):
+        return self._remove(self._user_grants, user.pk, permission, parameter_values)
+
+    def get_user_ids(self, permission, parameter_values, using):
+        keys = {(permission.code, EMPTY_PARAMETERS_HASH), (permission.code, hash_parameters(parameter_values))}
+        with self._lock:
+            user_ids = {user_id for user_id, grants in self._user_grants.items() if keys & grants.keys()}
+            group_ids = {group_id for group_id, grants in self._group_grants.items() if keys & grants.keys()}
+            user_ids.update(user_id for user_id, user_group_ids in self._memberships.items() if group_ids & user_group_ids)
+        return user_ids
+
+    def grant_group(self, group, permission, parameter_values):
+        self._add(self._group_grants, group.pk, permission, parameter_values)
+        grant_cache.invalidate_users(self._members(group.pk))
+
+    def revoke_group(self, group, permission, parameter_values):
+        deleted = self._remove(self._group_grants, group.pk, permission, parameter_values)
+        grant_cache.invalidate_users(self._members(group.pk))
+        return deleted
+
+    def add_to_group(self, user, group):
+        with self._lock:
+            self._memberships.setdefault(user.pk, set()).add(group.pk)
+        grant_cache.invalidate_users([user.pk])
+
+    def remove_from_group(self, user, group):
+        with self._lock:
+            self._memberships.get(user.pk, set()).discard(group.pk)
+        grant_cache.invalidate_users([user.pk])
+
+    def _members(self, group_id):
+        with self._lock:
+            return [user_id for user_id, group_ids in self._memberships.items() if group_id in group_ids]
+
+    def _add(self, grants_by_owner, owner_id, permission, parameter_values):
+        with self._lock:
+            grants = grants_by_owner.setdefault(owner_id, {})
+            if (permission.code, EMPTY_PARAMETERS_HASH) not in grants:
+                grants.setdefault((permission.code, hash_parameters(parameter_values)), dict(parameter_values))
+
+    def _remove(self, grants_by_owner, owner_id, permission, parameter_values):
+        with self._lock:
+            grants = grants_by_owner.get(owner_id, {})
+            return 0 if grants.pop((permission.code, hash_parameters(parameter_values)), None) is None else 1
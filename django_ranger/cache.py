@@ -0,0 +1,400 @@
+"""
+A cache of the effective grants of each user, shared between processes.
+
+It is enabled by the RANGER_GRANT_CACHE setting, the alias of the Django
+cache to use, and entries expire after RANGER_GRANT_CACHE_TIMEOUT seconds.
+The entries of the affected users are invalidated once the transaction
+changing their grants or groups commits.
+
+Each entry is stored with the generation of its key, renewed by every
+invalidation, and an entry of a previous generation is ignored. So a rebuild
+which loaded the grants before an invalidation can not overwrite it.
+
+A missing entry is rebuilt by a single caller at a time, holding a lock for
+up to RANGER_GRANT_CACHE_LOCK_TIMEOUT seconds. Meanwhile the other callers are
+served the entry invalidated last, kept for RANGER_GRANT_CACHE_STALE_TIMEOUT
+seconds, or wait for the rebuild up to RANGER_GRANT_CACHE_WAIT seconds
+before loading the grants themselves.
+"""
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .models import UserGrant, GroupGrant
+from .registry import get_permission
+
+CACHE_VERSION = 3
+DEFAULT_TIMEOUT = 3600
+DEFAULT_LOCK_TIMEOUT = 10
+DEFAULT_STALE_TIMEOUT = 60
+DEFAULT_WAIT = 0.5
+WAIT_INTERVAL = 0.02
+INVALIDATION_BATCH_SIZE = 1000
+
+
+def is_enabled():
+    return getattr(settings, 'RANGER_GRANT_CACHE', None) is not None
+
+
+def get_cache():
+    return caches[settings.RANGER_GRANT_CACHE]
+
+
+def get_timeout():
+    return getattr(settings, 'RANGER_GRANT_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def get_lock_timeout():
+    return getattr(settings, 'RANGER_GRANT_CACHE_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT)
+
+
+def get_stale_timeout():
+    return getattr(settings, 'RANGER_GRANT_CACHE_STALE_TIMEOUT', DEFAULT_STALE_TIMEOUT)
+
+
+def get_wait():
+    return getattr(settings, 'RANGER_GRANT_CACHE_WAIT', DEFAULT_WAIT)
+
+
+def grants_key(user_id):
+    return 'ranger:grants:v%s:%s' % (CACHE_VERSION, user_id)
+
+
+def stale_key(key):
+    return '%s:stale' % key
+
+
+def lock_key(key):
+    return '%s:lock' % key
+
+
+def generation_key(key):
+    return '%s:generation' % key
+
+
+def group_version_key(group_id):
+    return 'ranger:group-version:%s' % group_id
+
+
+def partition_key(user_id, partition_by, name):
+    return 'ranger:grant-partition:v%s:%s:%s:%s' % (CACHE_VERSION, user_id, partition_by, name)
+
+
+def serialize_grants(grants):
+    """
+    Returns the given grants as a list of (code, parameter_values, parameters_hash, source).
+    """
+    return [(grant.permission.code, grant.parameter_values, grant.parameters_hash, grant.source) for grant in grants]
+
+
+def deserialize_grants(user, data):
+    """
+    Returns the UserGrant instances of the given serialized grants. Their
+    permissions are taken from the permissions loaded in memory.
+    """
+    grants = []
+    for code, parameter_values, parameters_hash, source in data:
+        grant = UserGrant(user=user, permission=get_permission(code),
+                          parameter_values=parameter_values, parameters_hash=parameters_hash)
+        grant.source = source
+        grants.append(grant)
+    return grants
+
+
+def get_generations(keys):
+    """
+    Returns a dict of the given keys and their current generation. Unknown
+    generations are started with a random value, so an entry of an evicted
+    generation can not match the new one.
+    """
+    cache = get_cache()
+    generation_keys = {generation_key(key): key for key in keys}
+    generations = {generation_keys[key]: generation for key, generation in cache.get_many(list(generation_keys)).items()}
+    for key in keys:
+        if key not in generations:
+            cache.add(generation_key(key), uuid4().hex, None)
+            generations[key] = cache.get(generation_key(key))
+    return generations
+
+
+def get_entry(key, generation_of=None):
+    """
+    Returns the data cached under the given key, or None when it is missing
+    or of a previous generation of the `generation_of` key, by default itself.
+    """
+    generation = generation_key(generation_of or key)
+    values = get_cache().get_many([key, generation])
+    entry = values.get(key)
+    if entry is None or entry[0] != values.get(generation):
+        return None
+    return entry[1]
+
+
+def get_user_grants(user):
+    """
+    Returns the cached grants of the given user, or None when they are not cached.
+    """
+    return _deserialize_user_grants(user, get_entry(grants_key(user.pk)))
+
+
+def _deserialize_user_grants(user, data):
+    if not isinstance(data, list):
+        return None
+    return deserialize_grants(user, data)
+
+
+def rebuild_user_grants(user, load):
+    """
+    Returns the grants of the given user loaded by `load`, and caches them.
+    When another caller is already loading them, the previous version of the
+    grants is returned instead.
+    """
+    return rebuild(grants_key(user.pk), load, serialize_grants, lambda data: _deserialize_user_grants(user, data))
+
+
+def set_many_user_grants(grants_by_user, generations):
+    """
+    Caches the grants of many users at once, given a dict of user ids and
+    their grants, as rows returned by the grant backends, and the generations
+    of their keys read before loading them.
+    """
+    get_cache().set_many(
+        {grants_key(user_id): (generations[grants_key(user_id)], list(rows))
+         for user_id, rows in grants_by_user.items()},
+        get_timeout(),
+    )
+
+
+def get_user_entry(user):
+    """
+    Returns the cached grants of the given user and the ids of their groups,
+    for PermissionManager instances composing interned group policies, or None
+    when they are not cached.
+    """
+    return _deserialize_user_entry(user, get_entry(grants_key(user.pk)))
+
+
+def _serialize_user_entry(entry):
+    grants, group_ids = entry
+    return {'grants': serialize_grants(grants), 'groups': list(group_ids)}
+
+
+def _deserialize_user_entry(user, data):
+    if not isinstance(data, dict):
+        return None
+    return deserialize_grants(user, data['grants']), data['groups']
+
+
+def rebuild_user_entry(user, load):
+    """
+    Like `rebuild_user_grants`, for the (grants, group ids) entries of the
+    users whose group policies are interned.
+    """
+    return rebuild(grants_key(user.pk), load, _serialize_user_entry, lambda data: _deserialize_user_entry(user, data))
+
+
+def rebuild(key, load, serialize, deserialize, generation_of=None):
+    """
+    Returns the value loaded by `load` and caches it under the given key, with
+    the generation of the `generation_of` key, by default itself, when no
+    other caller is rebuilding it. Otherwise returns the stale version of the
+    key, or waits for the rebuilt one, and loads it as a last resort.
+    `deserialize` returns None for data it can not use.
+    """
+    cache = get_cache()
+    generation_of = generation_of or key
+    token = uuid4().hex
+    if cache.add(lock_key(key), token, get_lock_timeout()):
+        try:
+            generation = get_generations([generation_of])[generation_of]
+            value = load()
+            cache.set(key, (generation, serialize(value)), get_timeout())
+        finally:
+            # the lock may have expired and been taken by another caller
+            if cache.get(lock_key(key)) == token:
+                cache.delete(lock_key(key))
+        return value
+
+    # the copy kept at invalidation, or the entry of a previous generation, which is not deleted
+    stale = cache.get_many([stale_key(key), key])
+    value = deserialize(stale.get(stale_key(key)))
+    if value is None and key in stale:
+        value = deserialize(stale[key][1])
+    if value is not None:
+        return value
+
+    deadline = time.monotonic() + get_wait()
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        value = deserialize(get_entry(key, generation_of))
+        if value is not None:
+            return value
+        if cache.get(lock_key(key)) is None:
+            break
+    return load()
+
+
+def get_user_partition(user, partition_by, name):
+    """
+    Returns the cached grants of the given user for the permissions of a scope
+    or code, or None when they are not cached.
+    """
+    data = get_entry(partition_key(user.pk, partition_by, name), grants_key(user.pk))
+    return _deserialize_user_grants(user, data)
+
+
+def rebuild_user_partition(user, partition_by, name, load):
+    """
+    Like `rebuild_user_grants`, for the grants of the given user for the
+    permissions of a scope or code. The partitions of a user share the
+    generation of their other cached grants, so each partition does not need
+    to be invalidated.
+    """
+    return rebuild(partition_key(user.pk, partition_by, name), load, serialize_grants,
+                   lambda data: _deserialize_user_grants(user, data), generation_of=grants_key(user.pk))
+
+
+def get_group_versions(group_ids):
+    """
+    Returns a dict of the given group ids and the current version of their
+    grants. Unknown versions are renewed with a random value, so a version
+    evicted from the cache can not match a stale one. Versions expire like
+    the cached grants, which bounds the life of a version missed by an invalidation.
+    """
+    keys = {group_version_key(group_id): group_id for group_id in group_ids}
+    versions = {keys[key]: version for key, version in get_cache().get_many(list(keys)).items()}
+    for group_id in group_ids:
+        if group_id not in versions:
+            get_cache().add(group_version_key(group_id), uuid4().hex, get_timeout())
+            versions[group_id] = get_cache().get(group_version_key(group_id))
+    return versions
+
+
+def _on_commit(function, using):
+    if connections[using or DEFAULT_DB_ALIAS].settings_dict['ENGINE'] == 'django.db.backends.dummy':
+        # without a configured database, e.g. with the in-memory grant backend, there is no transaction
+        function()
+    else:
+        transaction.on_commit(function, using=using)
+
+
+def invalidate_users(user_ids, using=None):
+    """
+    Invalidates the cached grants of the given users once the current
+    transaction of the `using` database commits, keeping a stale copy to serve
+    while they are rebuilt.
+    """
+    if is_enabled():
+        user_ids = list(user_ids)
+        _on_commit(lambda: _invalidate_users(user_ids), using)
+
+
+def _invalidate_users(user_ids):
+    cache = get_cache()
+    for index in range(0, len(user_ids), INVALIDATION_BATCH_SIZE):
+        keys = [grants_key(user_id) for user_id in user_ids[index:index + INVALIDATION_BATCH_SIZE]]
+        current = cache.get_many(keys)
+        if current:
+            cache.set_many({stale_key(key): entry[1] for key, entry in current.items()}, get_stale_timeout())
+        cache.set_many({generation_key(key): uuid4().hex for key in keys}, None)
+        cache.delete_many(keys)
+
+
+def get_member_ids(group_ids, using=None):
+    return list(get_user_model().objects.using(using).filter(groups__in=list(group_ids))
+                .values_list('pk', flat=True).distinct())
+
+
+def invalidate_groups(group_ids, using=None):
+    """
+    Renews the version of the grants of the given groups, and invalidates the
+    cached grants of their members, once the current transaction of the
+    `using` database commits. The cached grants of the members of interned
+    group policies do not include the group grants, so they are kept.
+    """
+    if is_enabled():
+        keys = [group_version_key(group_id) for group_id in group_ids]
+        _on_commit(lambda: get_cache().delete_many(keys), using)
+        if not getattr(settings, 'RANGER_INTERN_GROUP_POLICIES', False):
+            invalidate_users(get_member_ids(group_ids, using), using=using)
+
+
+def load_user_entries(user_ids, using=None):
+    """
+    Returns a dict of the given user ids and their (grants, group ids)
+    entries, for the users whose group policies are interned, loaded with two
+    queries whatever the number of users.
+    """
+    user_ids = list(user_ids)
+    entries = {user_id: ([], []) for user_id in user_ids}
+
+    user_model = get_user_model()
+    user_field = user_model._meta.model_name
+    memberships = user_model.groups.through.objects.using(using).filter(**{'%s__in' % user_field: user_ids})
+    for user_id, group_id in memberships.values_list('%s_id' % user_field, 'group_id'):
+        entries[user_id][1].append(group_id)
+
+    for user_grant in UserGrant.objects.using(using).filter(user_id__in=user_ids).select_related('permission'):
+        entries[user_grant.user_id][0].append(user_grant)
+
+    return entries
+
+
+def set_many_user_entries(entries, generations):
+    """
+    Caches the (grants, group ids) entries of many users at once, given a dict
+    of user ids and their entries, and the generations of their keys read
+    before loading them.
+    """
+    get_cache().set_many(
+        {grants_key(user_id): (generations[grants_key(user_id)], _serialize_user_entry(entry))
+         for user_id, entry in entries.items()},
+        get_timeout(),
+    )
+
+
+def connect_signals():
+    """
+    Connects the signals which delete the cached grants when they change.
+    It is called when the application is ready if the cache is enabled.
+    """
+    for signal in (post_save, post_delete):
+        signal.connect(user_grant_changed, sender=UserGrant, dispatch_uid='django_ranger.cache.user_grant')
+        signal.connect(group_grant_changed, sender=GroupGrant, dispatch_uid='django_ranger.cache.group_grant')
+    m2m_changed.connect(user_groups_changed, sender=get_user_model().groups.through,
+                        dispatch_uid='django_ranger.cache.user_groups')
+
+
+def disconnect_signals():
+    for signal in (post_save, post_delete):
+        signal.disconnect(sender=UserGrant, dispatch_uid='django_ranger.cache.user_grant')
+        signal.disconnect(sender=GroupGrant, dispatch_uid='django_ranger.cache.group_grant')
+    m2m_changed.disconnect(sender=get_user_model().groups.through, dispatch_uid='django_ranger.cache.user_groups')
+
+
+def user_grant_changed(sender, instance, using=None, **kwargs):
+    invalidate_users([instance.user_id], using=using)
+
+
+def group_grant_changed(sender, instance, using=None, **kwargs):
+    invalidate_groups([instance.group_id], using=using)
+
+
+def user_groups_changed(sender, instance, action, reverse, model, pk_set, using=None, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if not reverse:
+        # the groups of a user changed
+        invalidate_users([instance.pk], using=using)
+    elif action == 'pre_clear':
+        # every member of a group is going to be removed
+        invalidate_users(get_member_ids([instance.pk], using), using=using)
+    else:
+        # some members of a group changed
+        invalidate_users(pk_set, using=using)
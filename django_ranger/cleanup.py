@@ -0,0 +1,142 @@
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.db.models.fields.json import KeyTransform
+from django.db.models.signals import post_delete
+
+from .models import UserGrant, GroupGrant
+
+DEFAULT_BATCH_SIZE = 1000
+
+# parameter name -> (model, field name)
+_parameter_models = {}
+
+
+def register_parameter_model(parameter_name, model, field='pk'):
+    """
+    Ties a permission parameter to a model, so that the grants whose
+    `parameter_values[parameter_name]` references a deleted instance are removed.
+
+    e.g:
+    register_parameter_model('store_id', Store)
+
+    It should be called from the `ready()` method of the application config.
+    """
+    _parameter_models[parameter_name] = (model, field)
+    post_delete.connect(_delete_instance_grants, sender=model, dispatch_uid=_dispatch_uid(model))
+
+
+def unregister_parameter_model(parameter_name):
+    model, field = _parameter_models.pop(parameter_name)
+    if not any(registered_model is model for registered_model, _ in _parameter_models.values()):
+        post_delete.disconnect(sender=model, dispatch_uid=_dispatch_uid(model))
+
+
+def get_parameter_models():
+    """
+    Returns a dict of the registered parameter names and their (model, field name).
+    """
+    return dict(_parameter_models)
+
+
+def delete_grants(parameter_name, values, batch_size=None):
+    """
+    Deletes every UserGrant and GroupGrant whose `parameter_values[parameter_name]`
+    is any of the given values, and returns the number of deleted grants.
+
+    Without `batch_size` each grant table is cleaned with a single DELETE,
+    otherwise the grants are deleted in batches of `batch_size` rows.
+    """
+    values = list(values)
+    if not values:
+        return 0
+
+    # containment lookups can use the GIN index over parameter_values
+    query = reduce(or_, [Q(parameter_values__contains={parameter_name: value}) for value in values])
+
+    deleted = 0
+    for grant_model in (UserGrant, GroupGrant):
+        queryset = grant_model.objects.filter(query)
+        if batch_size is None:
+            deleted += queryset.delete()[0]
+            continue
+
+        while True:
+            ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted += grant_model.objects.filter(pk__in=ids).delete()[0]
+
+    return deleted
+
+
+def delete_dangling_grants(parameter_name, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Deletes the grants whose `parameter_values[parameter_name]` references an
+    instance which does not exist anymore, and returns the number of deleted grants.
+    """
+    model, field = _parameter_models[parameter_name]
+    model_field = _get_field(model, field)
+
+    referenced_values = set()
+    for grant_model in (UserGrant, GroupGrant):
+        referenced_values.update(
+            grant_model.objects
+            .filter(parameter_values__has_key=parameter_name)
+            .annotate(referenced_value=KeyTransform(parameter_name, 'parameter_values'))
+            .values_list('referenced_value', flat=True)
+            .distinct()
+        )
+
+    referenced_values = list(referenced_values)
+    dangling_values = []
+    for index in range(0, len(referenced_values), batch_size):
+        normalized_values = {}
+        for value in referenced_values[index:index + batch_size]:
+            try:
+                normalized_values.setdefault(model_field.to_python(value), []).append(value)
+            except ValidationError:
+                # this value can not reference any instance
+                dangling_values.append(value)
+
+        existing = set(model._base_manager
+                       .filter(**{'%s__in' % model_field.attname: list(normalized_values)})
+                       .values_list(model_field.attname, flat=True))
+        for normalized_value, values in normalized_values.items():
+            if normalized_value not in existing:
+                dangling_values.extend(values)
+
+    deleted = 0
+    for index in range(0, len(dangling_values), batch_size):
+        deleted += delete_grants(parameter_name, dangling_values[index:index + batch_size], batch_size=batch_size)
+    return deleted
+
+
+def _get_field(model, field):
+    if field == 'pk':
+        return model._meta.pk
+    return model._meta.get_field(field)
+
+
+def _dispatch_uid(model):
+    return 'django_ranger.cleanup.%s' % model._meta.label
+
+
+def _referencing_values(value):
+    """
+    Returns the values of a parameter which reference the given field value:
+    its text, and the number itself, as parameters without a declared type
+    are stored as they were given.
+    """
+    values = [str(value)]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        values.insert(0, value)
+    return values
+
+
+def _delete_instance_grants(sender, instance, **kwargs):
+    for parameter_name, (model, field) in list(_parameter_models.items()):
+        if model is sender:
+            delete_grants(parameter_name, _referencing_values(getattr(instance, _get_field(model, field).attname)))
@@ -0,0 +1,16 @@
+from django.utils.functional import SimpleLazyObject
+
+from .services import get_permission_manager
+
+
+def permissions(request):
+    """
+    Adds `ranger_permissions`, the request-scoped PermissionManager of the
+    request user, to the template context. It is None for anonymous users,
+    and the grants are only loaded when a template checks a permission.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {'ranger_permissions': None}
+
+    return {'ranger_permissions': SimpleLazyObject(lambda: get_permission_manager(request))}
@@ -1,10 +1,48 @@
 from functools import wraps
 
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
 from django.http import HttpResponseRedirect
+from django.utils.cache import get_cache_key, learn_cache_key, patch_cache_control, patch_response_headers
 from rest_framework import status
 from rest_framework.response import Response
 
-from .services import PermissionManager
+from .exceptions import ParameterError
+from .registry import get_definition, get_definitions
+from .services import get_permission_manager
+
+
+def prepare_action_list(action_list):
+    """
+    Returns the `action_list` as a list of (action_name, parameter_values) tuples,
+    accepting bare permission codes for permissions without parameters.
+
+    When permissions are declared in the registry, the actions are validated
+    against their declarations and their parameter values are normalized, so
+    typos raise ImproperlyConfigured when the view is decorated.
+    """
+    if action_list is None:
+        return []
+
+    final_action_list = []
+    check_definitions = bool(get_definitions())
+    for action in action_list:
+        if type(action) not in [tuple, list]:
+            action = (action, {})
+
+        action_name, parameter_values = action
+        if check_definitions:
+            definition = get_definition(action_name)
+            if definition is None:
+                raise ImproperlyConfigured("Permission {} is not declared".format(action_name))
+            try:
+                parameter_values = definition.normalize(parameter_values)
+            except ParameterError as error:
+                raise ImproperlyConfigured(str(error))
+
+        final_action_list.append((action_name, parameter_values))
+
+    return final_action_list
 
 
 def permission_required(action_list=None, permission_class=None, *args, **kwargs):
@@ -19,9 +57,7 @@ def permission_required(action_list=None, permission_class=None, *args, **kwargs
     This decorator only works over django function based views. This is not tested for
     rest framework function based view.
     """
-
-    if action_list is None:
-        action_list = []
+    action_list = prepare_action_list(action_list)
 
     def renderer(function):
         @wraps(function)
@@ -38,15 +74,9 @@ def permission_required(action_list=None, permission_class=None, *args, **kwargs
             if permission_class:
                 permissions_list = permission_class(request=obj, **kwargs).get_permissions()
             else:
-                final_action_list = []
-                for action in action_list:
-                    if type(action) not in [tuple, list]:
-                        action = (action, {})
-                    final_action_list.append(action)
-
-                permissions_list = final_action_list
+                permissions_list = action_list
 
-            user_permission = PermissionManager(user)
+            user_permission = get_permission_manager(obj)
             if not user_permission.has_any_permission(permissions_list):
                 # TODO change URL for a url set in the django settings
                 return HttpResponseRedirect("/accounts/login/?next=" + request.path)
@@ -67,6 +97,8 @@ def api_permission_required(action_list=None, permission_class=None, *args, **kw
 
     This decorator only works over api views.
     """
+    action_list = prepare_action_list(action_list)
+
     def renderer(function):
         @wraps(function)
         def wrapper(obj, *args, **kwargs):
@@ -83,10 +115,88 @@ def api_permission_required(action_list=None, permission_class=None, *args, **kw
             else:
                 permissions_list = action_list
 
-            user_permission = PermissionManager(user)
+            user_permission = get_permission_manager(obj)
             if not user_permission.has_any_permission(permissions_list):
                 return Response(status=status.HTTP_403_FORBIDDEN)
 
             return function(obj, *args, **kwargs)
         return wrapper
     return renderer
+
+
+def grants_cache_key_prefix(request, key_prefix='ranger:response'):
+    """
+    Returns a cache key prefix shared by the users whose effective grants are
+    the same, or None for anonymous users.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None
+    return '%s:%s' % (key_prefix, get_permission_manager(request).fingerprint())
+
+
+def _is_cacheable(response):
+    """
+    Returns whether a response can be shared between users: successful,
+    without cookies and not private.
+    """
+    if response.status_code != 200 or response.cookies:
+        return False
+    if response.has_header('Cache-Control'):
+        cache_control = response['Cache-Control'].lower()
+        if 'private' in cache_control or 'no-store' in cache_control:
+            return False
+    return True
+
+
+def cache_page_by_grants(timeout, cache='default', key_prefix='ranger:response'):
+    """
+    This decorator caches the successful GET and HEAD responses of a view by
+    the fingerprint of the user grants, so users with identical grants share
+    cached responses. Keys are built like the Django cache middleware does,
+    from the absolute URL and the headers of the response Vary header.
+
+    Responses setting cookies or marked private or no-store are not cached,
+    and the cached ones are marked private, so they are not shared by other caches.
+
+    It must only decorate views whose response depends on the requested URL
+    and the user grants, not on any other user attribute.
+    """
+    def renderer(function):
+        @wraps(function)
+        def wrapper(request, *args, **kwargs):
+            prefix = None
+            if request.method in ('GET', 'HEAD'):
+                prefix = grants_cache_key_prefix(request, key_prefix)
+
+            if prefix is None:
+                return function(request, *args, **kwargs)
+
+            response_cache = caches[cache]
+            key = get_cache_key(request, prefix, 'GET', cache=response_cache)
+            if key is not None:
+                response = response_cache.get(key)
+                if response is None and request.method == 'HEAD':
+                    key = get_cache_key(request, prefix, 'HEAD', cache=response_cache)
+                    response = response_cache.get(key) if key is not None else None
+                if response is not None:
+                    return response
+
+            response = function(request, *args, **kwargs)
+            if not _is_cacheable(response):
+                return response
+
+            patch_response_headers(response, timeout)
+            patch_cache_control(response, private=True)
+
+            def store(response):
+                key = learn_cache_key(request, response, timeout, prefix, cache=response_cache)
+                response_cache.set(key, response, timeout)
+
+            if hasattr(response, 'render') and callable(response.render) and not response.is_rendered:
+                response.add_post_render_callback(store)
+            else:
+                store(response)
+            return response
+        return wrapper
+    return renderer
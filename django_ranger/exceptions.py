@@ -16,4 +16,11 @@ class DoesNotExist(BaseException):
 class PermissionNotRevocable(BaseException):
     """
     Used when UserGrant its tried to be revoked but the permission has been granted by GroupGrant
-    """
\ No newline at end of file
+    """
+
+
+class InvalidSnapshot(BaseException):
+    """
+    Used when a grant snapshot token is malformed, tampered, expired or of an unknown version.
+    """
+    pass
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...cleanup import DEFAULT_BATCH_SIZE, delete_dangling_grants, get_parameter_models
+
+
+class Command(BaseCommand):
+    help = 'Deletes the grants whose parameter values reference deleted instances of the registered models.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('parameters', nargs='*',
+                            help='The parameter names to reconcile. All registered parameters by default.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='The number of values and grants handled per query.')
+
+    def handle(self, *args, **options):
+        parameter_models = get_parameter_models()
+        parameters = options['parameters'] or sorted(parameter_models)
+        for parameter_name in parameters:
+            if parameter_name not in parameter_models:
+                raise CommandError('Parameter {} is not registered'.format(parameter_name))
+
+            deleted = delete_dangling_grants(parameter_name, batch_size=options['batch_size'])
+            self.stdout.write('{}: {} grants deleted'.format(parameter_name, deleted))
@@ -0,0 +1,56 @@
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from ...rls import DEFAULT_SETTING, generate_sql, get_models
+
+
+class Command(BaseCommand):
+    help = ('Prints, or applies, the Postgres row level security policies which filter the tables of the '
+            'registered models like RangerQuerySet does.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*',
+                            help='The registered models, as app_label.ModelName. All registered models by default.')
+        parser.add_argument('--role', required=True,
+                            help='The role of the connections whose reads are filtered, e.g. the reporting one.')
+        parser.add_argument('--setting', default=DEFAULT_SETTING,
+                            help='The session variable holding the current user id.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='The database to generate the policies for.')
+        parser.add_argument('--apply', action='store_true',
+                            help='Executes the statements instead of printing them.')
+
+    def handle(self, *args, **options):
+        registered = get_models()
+        models = None
+        if options['models']:
+            models = []
+            for label in options['models']:
+                try:
+                    model = apps.get_model(label)
+                except (LookupError, ValueError) as e:
+                    raise CommandError(str(e))
+                if model not in registered:
+                    raise CommandError('Model {} is not registered'.format(label))
+                models.append(model)
+
+        connection = connections[options['database']]
+        if connection.vendor != 'postgresql':
+            raise CommandError('Row level security policies are only supported by Postgres')
+
+        try:
+            statements = generate_sql(connection, options['role'], models, setting=options['setting'])
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        if not options['apply']:
+            for statement in statements:
+                self.stdout.write(statement + ';')
+            return
+
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+        self.stdout.write('Applied {} statements'.format(len(statements)))
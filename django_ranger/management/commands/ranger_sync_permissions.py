@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...exceptions import ParameterError
+from ...models import Permission
+from ...registry import get_definitions, sync_permissions
+
+
+class Command(BaseCommand):
+    help = 'Creates and updates the permissions declared in the ranger.py modules of the installed applications.'
+
+    def handle(self, *args, **options):
+        try:
+            created, updated = sync_permissions()
+        except ParameterError as error:
+            raise CommandError(str(error))
+        self.stdout.write('{} permissions created, {} updated'.format(created, updated))
+
+        undeclared = Permission.objects.exclude(code__in=list(get_definitions())).values_list('code', flat=True)
+        for code in undeclared:
+            self.stdout.write('Permission {} is not declared'.format(code))
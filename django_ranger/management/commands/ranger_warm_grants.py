@@ -0,0 +1,75 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth import get_user_model
+from django.db import connections, router
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import cache, policies
+from ...backends import ORMGrantBackend, get_backend
+from ...models import UserGrant
+
+
+def warm_chunk(user_ids):
+    """
+    Loads and caches the effective grants of a chunk of users with the grant
+    backend, or their own grants and groups when group policies are interned,
+    and returns the number of warmed users.
+    """
+    # generations are read first, so the grants invalidated while loading are not cached
+    generations = cache.get_generations([cache.grants_key(user_id) for user_id in user_ids])
+    backend = get_backend()
+    if policies.is_enabled() and isinstance(backend, ORMGrantBackend):
+        entries = cache.load_user_entries(user_ids)
+        cache.set_many_user_entries(entries, generations)
+        return len(entries)
+
+    grants_by_user = backend.load_many_grants(user_ids, router.db_for_read(UserGrant))
+    cache.set_many_user_grants(grants_by_user, generations)
+    return len(grants_by_user)
+
+
+def init_worker():
+    # needed when worker processes are spawned instead of forked
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = 'Precomputes and caches the effective grants of all users, or the given users or group members.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, nargs='+', help='The ids of the users to warm.')
+        parser.add_argument('--groups', type=int, nargs='+', help='Warm only the members of these groups.')
+        parser.add_argument('--active', action='store_true', help='Warm only active users.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='The number of users loaded per query.')
+        parser.add_argument('--workers', type=int, default=1, help='The number of worker processes.')
+
+    def handle(self, *args, **options):
+        if not cache.is_enabled():
+            raise CommandError('The grant cache is disabled, set the RANGER_GRANT_CACHE setting.')
+
+        users = get_user_model()._default_manager.order_by('pk')
+        if options['users']:
+            users = users.filter(pk__in=options['users'])
+        if options['groups']:
+            users = users.filter(groups__in=options['groups']).distinct()
+        if options['active']:
+            users = users.filter(is_active=True)
+
+        user_ids = list(users.values_list('pk', flat=True))
+        chunk_size = options['chunk_size']
+        chunks = [user_ids[index:index + chunk_size] for index in range(0, len(user_ids), chunk_size)]
+
+        started_at = time.monotonic()
+        if options['workers'] > 1:
+            # workers must open their own connections instead of sharing the inherited ones
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as executor:
+                warmed = sum(executor.map(warm_chunk, chunks))
+        else:
+            warmed = sum(map(warm_chunk, chunks))
+        elapsed = time.monotonic() - started_at
+
+        self.stdout.write('Warmed {} users in {:.2f}s ({:.0f} users/s)'.format(
+            warmed, elapsed, warmed / elapsed if elapsed else 0))
@@ -0,0 +1,32 @@
+# Generated by Django 4.1.13 on 2026-10-19 18:54
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_ranger', '0002_auto_20181030_1617'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='groupgrant',
+            name='parameter_values',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='usergrant',
+            name='parameter_values',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddIndex(
+            model_name='groupgrant',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['parameter_values'], name='groupgrant_params_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='usergrant',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['parameter_values'], name='usergrant_params_gin'),
+        ),
+    ]
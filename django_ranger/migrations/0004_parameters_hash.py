@@ -0,0 +1,68 @@
+# Generated by Django 4.1.13 on 2026-10-19 18:56
+
+from django.db import migrations, models
+
+from django_ranger.parameters import hash_parameters
+
+
+def set_parameters_hash(apps, schema_editor):
+    """
+    Sets the parameters_hash of the existing grants, removing the grants
+    which become duplicated once their parameter values are canonical.
+    """
+    for model_name, owner_field in (('UserGrant', 'user_id'), ('GroupGrant', 'group_id')):
+        grant_model = apps.get_model('django_ranger', model_name)
+        seen = set()
+        duplicated_ids = []
+        updated_grants = []
+        for grant in grant_model.objects.order_by('id').iterator():
+            grant.parameters_hash = hash_parameters(grant.parameter_values)
+            key = (getattr(grant, owner_field), grant.permission_id, grant.parameters_hash)
+            if key in seen:
+                duplicated_ids.append(grant.id)
+                continue
+            seen.add(key)
+            updated_grants.append(grant)
+            if len(updated_grants) == 1000:
+                grant_model.objects.bulk_update(updated_grants, ['parameters_hash'])
+                updated_grants = []
+
+        grant_model.objects.bulk_update(updated_grants, ['parameters_hash'])
+        grant_model.objects.filter(id__in=duplicated_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_ranger', '0003_parameter_values_index'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='groupgrant',
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='usergrant',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='groupgrant',
+            name='parameters_hash',
+            field=models.BigIntegerField(default=137279666008780115, editable=False, help_text='A hash of the canonical parameter_values, set on save'),
+        ),
+        migrations.AddField(
+            model_name='usergrant',
+            name='parameters_hash',
+            field=models.BigIntegerField(default=137279666008780115, editable=False, help_text='A hash of the canonical parameter_values, set on save'),
+        ),
+        migrations.RunPython(set_parameters_hash, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='groupgrant',
+            unique_together={('group', 'permission', 'parameters_hash')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='usergrant',
+            unique_together={('user', 'permission', 'parameters_hash')},
+        ),
+    ]
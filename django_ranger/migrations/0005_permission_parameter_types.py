@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-19 18:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_ranger', '0004_parameters_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='permission',
+            name='parameter_types',
+            field=models.JSONField(blank=True, default=dict, help_text='A mapping of parameter names to their type: "int", "str", "uuid" or a list of allowed values.'),
+        ),
+    ]
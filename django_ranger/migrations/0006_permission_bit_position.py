@@ -0,0 +1,27 @@
+# Generated by Django 4.1.13 on 2026-10-19 19:00
+
+from django.db import migrations, models
+
+
+def set_bit_positions(apps, schema_editor):
+    permission_model = apps.get_model('django_ranger', 'Permission')
+    permissions = list(permission_model.objects.order_by('id'))
+    for position, permission in enumerate(permissions):
+        permission.bit_position = position
+    permission_model.objects.bulk_update(permissions, ['bit_position'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_ranger', '0005_permission_parameter_types'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='permission',
+            name='bit_position',
+            field=models.PositiveIntegerField(editable=False, help_text='A stable position of this permission in the bitmasks of permissions without parameters', null=True, unique=True),
+        ),
+        migrations.RunPython(set_bit_positions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.13 on 2026-10-19 19:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_ranger', '0006_permission_bit_position'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='groupgrant',
+            name='parameters_hash',
+            field=models.BigIntegerField(editable=False, help_text='A hash of the canonical parameter_values, set on save'),
+        ),
+        migrations.AlterField(
+            model_name='usergrant',
+            name='parameters_hash',
+            field=models.BigIntegerField(editable=False, help_text='A hash of the canonical parameter_values, set on save'),
+        ),
+    ]
@@ -3,9 +3,16 @@ from collections import Counter
 
 from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.db import connections, models, router, transaction
+from django.db.models import Max
 
-from .validations import ValidatingGrantModel
+from .exceptions import ParameterError
+from .parameters import EMPTY_PARAMETERS_HASH, hash_parameters, normalize_parameters
+from .validations import ValidatingGrantModel, ValidatingGrantQuerySet
+
+# the key of the Postgres advisory lock serializing the allocation of bit positions
+BIT_POSITION_LOCK_ID = 0x72616e676572
 
 
 class Permission(models.Model):
@@ -36,12 +43,64 @@ class Permission(models.Model):
         default=list,
     )
 
+    parameter_types = models.JSONField(
+        help_text='A mapping of parameter names to their type: "int", "str", "uuid" or a list of allowed values.',
+        blank=True,
+        default=dict,
+    )
+
+    bit_position = models.PositiveIntegerField(
+        help_text='A stable position of this permission in the bitmasks of permissions without parameters',
+        unique=True,
+        null=True,
+        editable=False,
+    )
+
     def __repr__(self):
         return 'Permission(%r, parameters=%r)' % (self.code, self.parameters_definition)
 
     def __str__(self):
         return self.code
 
+    def save(self, *args, **kwargs):
+        if self.bit_position is not None:
+            return super(Permission, self).save(*args, **kwargs)
+
+        using = kwargs.get('using') or router.db_for_write(Permission, instance=self)
+        with transaction.atomic(using=using):
+            self.bit_position = Permission.next_bit_position(using)
+            super(Permission, self).save(*args, **kwargs)
+
+    @classmethod
+    def next_bit_position(cls, using=None):
+        """
+        Returns the first bit position after the assigned ones.
+
+        It takes a lock on the allocation of bit positions, held until the end
+        of the current transaction, so the positions must be assigned in the
+        same transaction for concurrent allocations not to return the same one.
+        """
+        using = using or router.db_for_write(cls)
+        with connections[using].cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [BIT_POSITION_LOCK_ID])
+        last_position = cls.objects.using(using).aggregate(last_position=Max('bit_position'))['last_position']
+        return 0 if last_position is None else last_position + 1
+
+    @property
+    def bit(self):
+        return 1 << self.bit_position
+
+
+def compute_parameters_hash(grant):
+    """
+    Returns the hash of the normalized parameter values of a grant, saved or
+    not, or None when they can not be normalized.
+    """
+    try:
+        return hash_parameters(normalize_parameters(grant.permission.parameter_types, grant.parameter_values))
+    except ParameterError:
+        return None
+
 
 class UserGrant(ValidatingGrantModel, models.Model):
     """
@@ -69,8 +128,22 @@ class UserGrant(ValidatingGrantModel, models.Model):
         default=dict,
     )
 
+    # without default, so a grant written without computing its hash fails
+    parameters_hash = models.BigIntegerField(
+        help_text='A hash of the canonical parameter_values, set on save',
+        editable=False,
+    )
+
+    # 'group' for the unsaved instances converted from a GroupGrant
+    source = 'user'
+
+    objects = ValidatingGrantQuerySet.as_manager()
+
     class Meta:
-        unique_together = ('user', 'permission', 'parameter_values')
+        unique_together = ('user', 'permission', 'parameters_hash')
+        indexes = [
+            GinIndex(fields=['parameter_values'], name='usergrant_params_gin'),
+        ]
 
     def __repr__(self):
         return 'UserGrant(%r, permission=%r)' % (self.user.first_name, self.permission.code)
@@ -81,10 +154,15 @@ class UserGrant(ValidatingGrantModel, models.Model):
     def complies(self, expected_grant):
         """
         Verifies if the grant match with the expected grant.
+
+        Parameters are compared normalized to the permission parameter types,
+        so the expected grant does not need to be saved.
         """
-        permissions_are_equal = self.permission == expected_grant.permission
-        parameters_are_equal = self.parameter_values == expected_grant.parameter_values
-        return permissions_are_equal and (parameters_are_equal or self.parameter_values == {})
+        if self.permission != expected_grant.permission:
+            return False
+        parameters_hash = self.parameters_hash if self.parameters_hash is not None else compute_parameters_hash(self)
+        expected_hash = compute_parameters_hash(expected_grant)
+        return parameters_hash == EMPTY_PARAMETERS_HASH or (expected_hash is not None and parameters_hash == expected_hash)
 
     def complies_any(self, action_list):
         """
@@ -123,8 +201,19 @@ class GroupGrant(ValidatingGrantModel, models.Model):
         default=dict,
     )
 
+    # without default, so a grant written without computing its hash fails
+    parameters_hash = models.BigIntegerField(
+        help_text='A hash of the canonical parameter_values, set on save',
+        editable=False,
+    )
+
+    objects = ValidatingGrantQuerySet.as_manager()
+
     class Meta:
-        unique_together = ('group', 'permission', 'parameter_values')
+        unique_together = ('group', 'permission', 'parameters_hash')
+        indexes = [
+            GinIndex(fields=['parameter_values'], name='groupgrant_params_gin'),
+        ]
 
     def __repr__(self):
         return 'GroupGrant(%r, permission=%r)' % (self.group.name, self.permission.code)
@@ -141,4 +230,6 @@ class GroupGrant(ValidatingGrantModel, models.Model):
             user_grant.user = user
         user_grant.permission = self.permission
         user_grant.parameter_values = self.parameter_values
+        user_grant.parameters_hash = self.parameters_hash
+        user_grant.source = 'group'
         return user_grant
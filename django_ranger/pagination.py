@@ -0,0 +1,109 @@
+import base64
+import json
+from functools import reduce
+from operator import and_, or_
+
+from django.core.paginator import InvalidPage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class KeysetPage(object):
+    """
+    A page of a KeysetPaginator, with the cursor of the next page when there is one.
+    """
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __repr__(self):
+        return '<KeysetPage of %d objects>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class KeysetPaginator(object):
+    """
+    Paginates a QuerySet, like a RangerQuerySet and its permission filter, by
+    seeking the rows after the last row of the previous page instead of using
+    OFFSET, so every page costs the same as the first one.
+
+    The `ordering` fields must be non nullable, and the primary key is added
+    to them when missing so rows have a unique order. e.g:
+
+    paginator = KeysetPaginator(queryset, ordering=('-created_at',), per_page=50)
+    page = paginator.page(request.GET.get('cursor'))
+    """
+
+    def __init__(self, queryset, ordering=('pk',), per_page=50):
+        ordering = list(ordering)
+        if not {'pk', '-pk', queryset.model._meta.pk.name, '-' + queryset.model._meta.pk.name} & set(ordering):
+            ordering.append('pk')
+
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page
+
+    def page(self, cursor=None):
+        """
+        Returns the KeysetPage after the given cursor, or the first page without it.
+        """
+        queryset = self.queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self._seek_query(self.decode_cursor(cursor)))
+
+        object_list = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(object_list) > self.per_page:
+            object_list = object_list[:self.per_page]
+            next_cursor = self.encode_cursor(object_list[-1])
+        return KeysetPage(object_list, next_cursor)
+
+    def encode_cursor(self, obj):
+        """
+        Returns the cursor which points after the given object.
+        """
+        values = [self._get_value(obj, name.lstrip('-')) for name in self.ordering]
+        data = json.dumps({'o': self.ordering, 'v': values}, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode('utf-8')).rstrip(b'=').decode('ascii')
+
+    def decode_cursor(self, cursor):
+        """
+        Returns the ordering values of the given cursor. It raises InvalidPage
+        when the cursor is malformed or was built for a different ordering.
+        """
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8'))
+            ordering, values = data['o'], data['v']
+        except (TypeError, ValueError, KeyError):
+            raise InvalidPage('Invalid cursor')
+
+        if ordering != self.ordering or len(values) != len(ordering):
+            raise InvalidPage('The cursor does not match the ordering')
+        return values
+
+    def _seek_query(self, values):
+        """
+        Returns a Query expression for the rows after the given ordering values:
+        (a > x) | (a = x & b > y) | ...
+        """
+        query_list = []
+        for index, name in enumerate(self.ordering):
+            field_name = name.lstrip('-')
+            lookup = '%s__%s' % (field_name, 'lt' if name.startswith('-') else 'gt')
+            equal = [Q(**{previous.lstrip('-'): value}) for previous, value in zip(self.ordering[:index], values)]
+            query_list.append(reduce(and_, equal + [Q(**{lookup: values[index]})]))
+        return reduce(or_, query_list)
+
+    def _get_value(self, obj, field_name):
+        if isinstance(obj, dict):
+            return obj[field_name]
+        return reduce(getattr, field_name.split('__'), obj)
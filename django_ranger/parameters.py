@@ -0,0 +1,108 @@
+import hashlib
+import json
+from uuid import UUID
+
+from .exceptions import ParameterError
+
+
+def normalize_parameters(parameter_types, parameter_values):
+    """
+    Returns a copy of `parameter_values` with each value converted to the type
+    declared for its parameter in `parameter_types`, which maps parameter names
+    to "int", "str", "uuid" or a list of allowed values.
+
+    Parameters without a declared type are kept as they are. It raises
+    ParameterError when a value can not be converted.
+    """
+    if not parameter_types:
+        return dict(parameter_values)
+
+    normalized = {}
+    for key, value in parameter_values.items():
+        parameter_type = parameter_types.get(key)
+        normalized[key] = value if parameter_type is None else normalize_value(parameter_type, value)
+    return normalized
+
+
+def normalize_value(parameter_type, value):
+    """
+    Returns the value converted to the given parameter type.
+    """
+    if isinstance(parameter_type, list):
+        choices = {str(choice): choice for choice in parameter_type}
+        if str(value) not in choices or isinstance(value, bool):
+            raise ParameterError(u"{!r} is not one of {!r}".format(value, parameter_type))
+        return choices[str(value)]
+
+    if parameter_type not in _converters:
+        raise ParameterError(u"unknown parameter type {!r}".format(parameter_type))
+
+    try:
+        return _converters[parameter_type](value)
+    except (TypeError, ValueError, AttributeError):
+        raise ParameterError(u"{!r} is not a valid {} value".format(value, parameter_type))
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        raise TypeError()
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError()
+    return int(value)
+
+
+def _to_str(value):
+    if not isinstance(value, (str, int, UUID)) or isinstance(value, bool):
+        raise TypeError()
+    return str(value)
+
+
+def _to_uuid(value):
+    if isinstance(value, UUID):
+        return str(value)
+    return str(UUID(value))
+
+
+_converters = {
+    'int': _to_int,
+    'str': _to_str,
+    'uuid': _to_uuid,
+}
+
+
+def canonical_parameters(parameter_values):
+    """
+    Returns the canonical JSON text of the given parameter values.
+
+    Keys are sorted and scalar values are compared by their text, so
+    `{"id": 1}` and `{"id": "1"}` have the same canonical form.
+    """
+    return json.dumps(
+        {key: _canonical_value(value) for key, value in parameter_values.items()},
+        sort_keys=True,
+        separators=(',', ':'),
+    )
+
+
+def hash_parameters(parameter_values):
+    """
+    Returns a signed 64 bits integer hash of the canonical form of the given
+    parameter values, which fits in a BigIntegerField.
+    """
+    digest = hashlib.blake2b(canonical_parameters(parameter_values).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def _canonical_value(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (str, int, float, UUID)):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: _canonical_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical_value(item) for item in value]
+    return value
+
+
+EMPTY_PARAMETERS_HASH = hash_parameters({})
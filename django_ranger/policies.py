@@ -0,0 +1,81 @@
+"""
+Per-process interning of the compiled grants of each group.
+
+When the RANGER_INTERN_GROUP_POLICIES setting is enabled, along with the grant
+cache, each group's grants are loaded and compiled once per process and version,
+and the PermissionManager of every member shares them. Group versions are kept
+in the grant cache and renewed when a transaction changing the group grants
+commits. Policies are loaded from the writing database, which replicas may lag
+behind, and are reloaded after RANGER_GRANT_CACHE_TIMEOUT seconds whatever their version.
+"""
+import time
+from threading import Lock
+
+from django.conf import settings
+from django.db import router
+
+from . import cache as grant_cache
+from .models import GroupGrant
+
+
+class CompiledPolicy(object):
+    """
+    The grants of a group, converted to UserGrant instances without user, and
+    indexed by permission code and parameters hash.
+    """
+
+    def __init__(self, grants):
+        self.grants = tuple(grants)
+        index = {}
+        for grant in self.grants:
+            index.setdefault(grant.permission.code, set()).add(grant.parameters_hash)
+        self.index = {code: frozenset(hashes) for code, hashes in index.items()}
+
+    def __repr__(self):
+        return 'CompiledPolicy(%d grants)' % len(self.grants)
+
+
+# group id -> (version, expiration time, CompiledPolicy)
+_policies = {}
+_policies_lock = Lock()
+
+
+def is_enabled():
+    return getattr(settings, 'RANGER_INTERN_GROUP_POLICIES', False) and grant_cache.is_enabled()
+
+
+def get_group_policies(group_ids):
+    """
+    Returns the CompiledPolicy of each given group. The groups whose current
+    version is not interned yet, or expired, are loaded with a single query.
+    """
+    versions = grant_cache.get_group_versions(group_ids)
+    now = time.monotonic()
+
+    policies = {}
+    missing_ids = []
+    for group_id in group_ids:
+        interned = _policies.get(group_id)
+        if interned is not None and interned[0] == versions[group_id] and interned[1] > now:
+            policies[group_id] = interned[2]
+        else:
+            missing_ids.append(group_id)
+
+    if missing_ids:
+        grants_by_group = {group_id: [] for group_id in missing_ids}
+        group_grants = GroupGrant.objects.using(router.db_for_write(GroupGrant)).filter(group_id__in=missing_ids)
+        for group_grant in group_grants.select_related('permission'):
+            grants_by_group[group_grant.group_id].append(group_grant.to_user_grant())
+
+        expires_at = now + grant_cache.get_timeout()
+        with _policies_lock:
+            for group_id, grants in grants_by_group.items():
+                policies[group_id] = CompiledPolicy(grants)
+                _policies[group_id] = (versions[group_id], expires_at, policies[group_id])
+
+    return [policies[group_id] for group_id in group_ids]
+
+
+def clear_policies():
+    with _policies_lock:
+        _policies.clear()
@@ -0,0 +1,140 @@
+"""
+SQL predicates of the RangerQuerySet permission filters.
+
+The granted values of each lookup are matched with a strategy chosen from their
+number: equalities joined by OR, an IN list, `= ANY(array)` or a join against a
+VALUES list. The strategy used below each threshold of the
+RANGER_PREDICATE_THRESHOLDS setting is e.g:
+
+RANGER_PREDICATE_THRESHOLDS = {'or': 4, 'in': 64, 'any': 1024}
+
+with 'values' beyond the last one. Grants of several parameters, and lookups
+which are not a path of fields, are always matched with equalities joined by OR.
+"""
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Lookup, Q
+from django.db.models.constants import LOOKUP_SEP
+
+DEFAULT_THRESHOLDS = {'or': 4, 'in': 64, 'any': 1024}
+
+
+def get_thresholds():
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    thresholds.update(getattr(settings, 'RANGER_PREDICATE_THRESHOLDS', {}))
+    return thresholds
+
+
+def choose_strategy(count, thresholds=None):
+    """
+    Returns the strategy to match the given number of values.
+    """
+    thresholds = thresholds or get_thresholds()
+    for strategy in ('or', 'in', 'any'):
+        if count <= thresholds[strategy]:
+            return strategy
+    return 'values'
+
+
+class ValuesLookup(Lookup):
+    """
+    A base for the lookups casting their values to the database type of the field.
+    """
+    prepare_rhs = False
+
+    def get_db_values(self, connection):
+        field = self.lhs.output_field
+        return [field.get_db_prep_value(value, connection, prepared=False) for value in self.rhs]
+
+    def get_cast(self, connection):
+        # the type of a cast, e.g. integer for an AutoField whose db_type is serial
+        db_type = self.lhs.output_field.cast_db_type(connection)
+        return '::%s' % db_type if db_type else ''
+
+
+class AnyOf(ValuesLookup):
+    """
+    Matches the values of an array parameter: `field = ANY(%s::type[])`.
+    """
+    lookup_name = 'ranger_any'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        cast = self.get_cast(connection)
+        return '%s = ANY(%%s%s)' % (lhs, cast + '[]' if cast else ''), list(lhs_params) + [self.get_db_values(connection)]
+
+
+class InValues(ValuesLookup):
+    """
+    Matches a VALUES list, which the planner can join like a table: `field IN (VALUES (%s), ...)`.
+    """
+    lookup_name = 'ranger_values'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        placeholders = ', '.join(['(%%s%s)' % self.get_cast(connection)] * len(self.rhs))
+        return '%s IN (VALUES %s)' % (lhs, placeholders), list(lhs_params) + self.get_db_values(connection)
+
+
+def is_field_path(model, lookup):
+    """
+    Returns whether the given lookup is a path of fields, without a lookup or transform.
+    """
+    for name in lookup.split(LOOKUP_SEP):
+        if model is None:
+            return False
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        model = field.related_model
+    return True
+
+
+def build_condition(model, params_list, thresholds=None):
+    """
+    Returns a Q allowing the rows which match any of the given dicts of
+    lookups and values, and a dict of the strategy used for each lookup, or
+    tuple of lookups when grants have several parameters.
+    """
+    thresholds = thresholds or get_thresholds()
+    groups = OrderedDict()
+    for params in params_list:
+        groups.setdefault(tuple(sorted(params)), []).append(params)
+
+    conditions = []
+    strategies = {}
+    for lookups, group in groups.items():
+        if len(lookups) != 1:
+            strategies[lookups] = 'or'
+            conditions.extend(Q(**params) for params in group)
+            continue
+
+        lookup = lookups[0]
+        try:
+            values = list(OrderedDict.fromkeys(params[lookup] for params in group))
+        except TypeError:
+            # unhashable values are only matched by equalities
+            values = [params[lookup] for params in group]
+            strategy = 'or'
+        else:
+            strategy = choose_strategy(len(values), thresholds)
+            if strategy != 'or' and not is_field_path(model, lookup):
+                # the lookup may end with its own lookup, which a list can not be given to
+                strategy = 'or'
+
+        strategies[lookup] = strategy
+        if strategy == 'or':
+            conditions.extend(Q(**{lookup: value}) for value in values)
+        elif strategy == 'in':
+            conditions.append(Q(**{lookup + LOOKUP_SEP + 'in': values}))
+        elif strategy == 'any':
+            conditions.append(Q(AnyOf(F(lookup), values)))
+        else:
+            conditions.append(Q(InValues(F(lookup), values)))
+
+    return reduce(or_, conditions), strategies
@@ -0,0 +1,294 @@
+"""
+A registry of the permissions declared in code.
+
+Each application can declare its permissions in a `ranger.py` module, which
+is imported when the application registry is ready:
+
+    from django_ranger import registry
+
+    registry.register('can_manage:store', scope='stores', parameters={'store_id': 'int'})
+
+The `ranger_sync_permissions` management command stores the declared
+permissions in the Permission table.
+
+Every process keeps the Permission rows in memory. A process reloads them once
+it changed a permission, and the others after RANGER_PERMISSION_TIMEOUT
+seconds. When the grant cache is enabled, they share a version of the
+permissions in it, renewed when a permission changes, and only reload them
+when it changed. Permissions changed without the Permission signals, e.g. by a
+migration or raw SQL, must be followed by `clear_permissions`, and are only
+seen by the other processes after that timeout.
+
+Without a configured database, e.g. in services using the in-memory grant
+backend, the permissions are built from their declarations instead, without
+bit positions.
+"""
+import time
+from threading import Lock
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils.module_loading import autodiscover_modules
+
+from .exceptions import ParameterError
+from .models import Permission, UserGrant, GroupGrant
+from .parameters import hash_parameters, normalize_parameters
+
+
+class PermissionDefinition(object):
+    """
+    A permission declared in code. The `parameters` are a list of parameter
+    names, or a dict of parameter names and their types.
+    """
+
+    def __init__(self, code, scope, description='', parameters=None):
+        if parameters is None:
+            parameters = {}
+        if not isinstance(parameters, dict):
+            parameters = {name: None for name in parameters}
+
+        self.code = code
+        self.scope = scope
+        self.description = description
+        self.parameters_definition = list(parameters)
+        self.parameter_types = {name: type_ for name, type_ in parameters.items() if type_ is not None}
+
+    def __repr__(self):
+        return 'PermissionDefinition(%r, parameters=%r)' % (self.code, self.parameters_definition)
+
+    def normalize(self, parameter_values):
+        """
+        Returns the given parameter values normalized to the parameter types,
+        and raises ParameterError when they are inconsistent with this definition.
+        """
+        values = sorted(parameter_values.keys())
+        if values != [] and values != sorted(self.parameters_definition):
+            raise ParameterError(u"parameters {} are inconsistent with {} parameters {}".format(
+                values, self.code, sorted(self.parameters_definition)))
+        return normalize_parameters(self.parameter_types, parameter_values)
+
+    def to_permission(self):
+        """
+        Returns an unsaved Permission of this definition.
+        """
+        return Permission(code=self.code, scope=self.scope, description=self.description,
+                          parameters_definition=self.parameters_definition, parameter_types=self.parameter_types)
+
+    def differs_from(self, permission):
+        return (
+            permission.scope != self.scope
+            or permission.description != self.description
+            or sorted(permission.parameters_definition) != sorted(self.parameters_definition)
+            or permission.parameter_types != self.parameter_types
+        )
+
+
+_definitions = {}
+
+DEFAULT_TIMEOUT = 60
+VERSION_KEY = 'ranger:permissions-version'
+
+# code -> Permission, loaded at once the first time a permission is requested.
+_permissions = None
+_permissions_lock = Lock()
+# the shared version of the loaded permissions, and the time to check it again
+_version = None
+_checked_until = 0.0
+
+
+def register(code, scope, description='', parameters=None):
+    """
+    Declares a permission, and returns its PermissionDefinition.
+    """
+    definition = PermissionDefinition(code, scope, description, parameters)
+    _definitions[code] = definition
+    return definition
+
+
+def unregister(code):
+    del _definitions[code]
+
+
+def get_definitions():
+    """
+    Returns a dict of the declared permission codes and their PermissionDefinition.
+    """
+    return dict(_definitions)
+
+
+def get_definition(code):
+    return _definitions.get(code)
+
+
+def autodiscover():
+    autodiscover_modules('ranger')
+
+
+def sync_permissions():
+    """
+    Creates and updates the Permission rows of the declared permissions in
+    bulk, and returns the number of created and updated permissions.
+
+    The grants of the permissions whose parameter types changed are normalized
+    to the new types. It raises ParameterError, and changes nothing, when
+    some of them can not be.
+    """
+    existing = {permission.code: permission for permission in Permission.objects.filter(code__in=list(_definitions))}
+
+    created = []
+    updated = []
+    retyped = []
+    for code, definition in sorted(_definitions.items()):
+        permission = existing.get(code)
+        if permission is None:
+            created.append(Permission(code=code, scope=definition.scope, description=definition.description,
+                                      parameters_definition=definition.parameters_definition,
+                                      parameter_types=definition.parameter_types))
+        elif definition.differs_from(permission):
+            if permission.parameter_types != definition.parameter_types:
+                retyped.append(permission)
+            permission.scope = definition.scope
+            permission.description = definition.description
+            permission.parameters_definition = definition.parameters_definition
+            permission.parameter_types = definition.parameter_types
+            updated.append(permission)
+
+    using = router.db_for_write(Permission)
+    with transaction.atomic(using=using):
+        # the positions are locked until the permissions are created
+        next_bit_position = Permission.next_bit_position(using)
+        for index, permission in enumerate(created):
+            permission.bit_position = next_bit_position + index
+
+        Permission.objects.bulk_create(created)
+        Permission.objects.bulk_update(updated, ['scope', 'description', 'parameters_definition', 'parameter_types'])
+        _normalize_grants(retyped, using)
+    clear_permissions()
+    return len(created), len(updated)
+
+
+def _normalize_grants(permissions, using):
+    """
+    Normalizes the parameter values of the grants of the given permissions to
+    their parameter types, and updates their hashes.
+    """
+    if not permissions:
+        return
+
+    permissions = {permission.pk: permission for permission in permissions}
+    errors = []
+    for grant_model in (UserGrant, GroupGrant):
+        changed = []
+        for grant in grant_model.objects.using(using).filter(permission_id__in=list(permissions)):
+            try:
+                parameter_values = normalize_parameters(permissions[grant.permission_id].parameter_types,
+                                                        grant.parameter_values)
+            except ParameterError as error:
+                errors.append(u"{} {}: {}".format(grant_model.__name__, grant.pk, error))
+                continue
+            parameters_hash = hash_parameters(parameter_values)
+            if parameter_values != grant.parameter_values or parameters_hash != grant.parameters_hash:
+                grant.parameter_values = parameter_values
+                grant.parameters_hash = parameters_hash
+                changed.append(grant)
+        grant_model.objects.using(using).bulk_update(changed, ['parameter_values', 'parameters_hash'])
+
+    if errors:
+        raise ParameterError(u"grants inconsistent with the new parameter types:\n" + u"\n".join(errors))
+
+
+def get_permission(code):
+    """
+    Returns the Permission with the given code from memory.
+
+    Every permission is loaded with a single query the first time, and a
+    permission missing from memory is looked up in the database. It raises
+    Permission.DoesNotExist when the permission does not exist.
+    """
+    permissions = _permissions
+    if permissions is None or time.monotonic() >= _checked_until:
+        permissions = _check_permissions()
+
+    permission = permissions.get(code)
+    if permission is None:
+        if not _has_database():
+            raise Permission.DoesNotExist('Permission {} is not declared'.format(code))
+        permission = Permission.objects.get(code=code)
+        permissions[code] = permission
+    return permission
+
+
+def _has_database():
+    engine = connections[router.db_for_read(Permission)].settings_dict['ENGINE']
+    return engine != 'django.db.backends.dummy'
+
+
+def get_timeout():
+    return getattr(settings, 'RANGER_PERMISSION_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def _get_shared_version():
+    """
+    Returns the version of the permissions shared in the grant cache, or None
+    when it is disabled.
+    """
+    from . import cache as grant_cache
+
+    if not grant_cache.is_enabled():
+        return None
+    cache = grant_cache.get_cache()
+    cache.add(VERSION_KEY, uuid4().hex, None)
+    return cache.get(VERSION_KEY)
+
+
+def _check_permissions():
+    """
+    Returns the permissions in memory when their shared version did not
+    change, and reloads them otherwise.
+    """
+    global _checked_until
+    version = _get_shared_version()
+    with _permissions_lock:
+        if _permissions is not None and version is not None and version == _version:
+            _checked_until = time.monotonic() + get_timeout()
+            return _permissions
+    return preload_permissions()
+
+
+def preload_permissions():
+    """
+    Loads every permission in memory, and returns them by code.
+    """
+    global _permissions, _version, _checked_until
+    # the version is read first, so a change committed while loading is reloaded
+    version = _get_shared_version()
+    with _permissions_lock:
+        if _has_database():
+            permissions = {permission.code: permission for permission in Permission.objects.all()}
+        else:
+            permissions = {code: definition.to_permission() for code, definition in _definitions.items()}
+        _permissions = permissions
+        _version = version
+        _checked_until = time.monotonic() + get_timeout()
+    return permissions
+
+
+def _renew_shared_version():
+    from . import cache as grant_cache
+
+    if grant_cache.is_enabled():
+        grant_cache.get_cache().delete(VERSION_KEY)
+
+
+def clear_permissions(*args, **kwargs):
+    """
+    Forgets the permissions loaded in memory, and renews their shared version
+    once the current transaction commits, so every process reloads them. It is
+    connected to the Permission signals, and must be called after changing
+    permissions without them.
+    """
+    global _permissions
+    with _permissions_lock:
+        _permissions = None
+    transaction.on_commit(_renew_shared_version, using=kwargs.get('using'))
@@ -0,0 +1,163 @@
+"""
+Postgres row level security policies equivalent to the RangerQuerySet filter.
+
+A model is registered with the permission definitions its querysets use:
+
+    register_model(Store, [('can_view:store', {'store_id': 'id'})])
+
+and the `ranger_rls_policies` management command generates, or applies, a
+view of the grants of the current user and a SELECT policy per registered
+table, for the members of the given role, e.g. the one of the reporting
+connections which bypass Django. They set the current user id in a session
+variable:
+
+    SET ranger.user_id = '42';
+
+The members of the role can only read the rows allowed by the grants, and
+nothing when the variable is not set. A second policy keeps every row
+available to the other roles, for every command, since enabling row level
+security denies every row to the roles without a policy.
+
+A row is visible when the user, or one of their groups, has one of the
+permissions without parameters, or with parameter values equal to the columns
+of its lookups. Lookups must be columns of the table itself.
+"""
+from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+
+from .models import Permission, UserGrant, GroupGrant
+
+DEFAULT_SETTING = 'ranger.user_id'
+VIEW_NAME = 'ranger_current_grants'
+
+# model -> permissions definition
+_models = {}
+
+
+def register_model(model, permissions_definition):
+    """
+    Registers the permission definitions, a list of (code, {parameter: lookup}),
+    which filter the rows of the given model.
+    """
+    _models[model] = list(permissions_definition)
+
+
+def unregister_model(model):
+    del _models[model]
+
+
+def get_models():
+    """
+    Returns a dict of the registered models and their permission definitions.
+    """
+    return dict(_models)
+
+
+def _literal(value):
+    return "'%s'" % str(value).replace("'", "''")
+
+
+def view_sql(connection, setting=DEFAULT_SETTING):
+    """
+    Returns the statement creating the view of the (code, parameter_values)
+    of the grants of the user whose id is in the given session variable.
+    """
+    quote_name = connection.ops.quote_name
+    user_model = get_user_model()
+    groups_field = user_model._meta.get_field('groups')
+    user_id = "NULLIF(current_setting(%s, true), '')::%s" % (
+        _literal(setting), user_model._meta.pk.rel_db_type(connection))
+    return (
+        "CREATE OR REPLACE VIEW {view} AS "
+        "SELECT {permission}.{code} AS code, {user_grant}.{user_values} AS parameter_values "
+        "FROM {user_grant} INNER JOIN {permission} ON {permission}.{id} = {user_grant}.{user_permission} "
+        "WHERE {user_grant}.{user} = {user_id} "
+        "UNION ALL "
+        "SELECT {permission}.{code}, {group_grant}.{group_values} "
+        "FROM {group_grant} INNER JOIN {permission} ON {permission}.{id} = {group_grant}.{group_permission} "
+        "INNER JOIN {membership} ON {membership}.{membership_group} = {group_grant}.{group} "
+        "WHERE {membership}.{membership_user} = {user_id}"
+    ).format(
+        view=quote_name(VIEW_NAME),
+        permission=quote_name(Permission._meta.db_table),
+        id=quote_name(Permission._meta.pk.column),
+        code=quote_name(Permission._meta.get_field('code').column),
+        user_grant=quote_name(UserGrant._meta.db_table),
+        user=quote_name(UserGrant._meta.get_field('user').column),
+        user_permission=quote_name(UserGrant._meta.get_field('permission').column),
+        user_values=quote_name(UserGrant._meta.get_field('parameter_values').column),
+        group_grant=quote_name(GroupGrant._meta.db_table),
+        group=quote_name(GroupGrant._meta.get_field('group').column),
+        group_permission=quote_name(GroupGrant._meta.get_field('permission').column),
+        group_values=quote_name(GroupGrant._meta.get_field('parameter_values').column),
+        membership=quote_name(groups_field.m2m_db_table()),
+        membership_user=quote_name(groups_field.m2m_column_name()),
+        membership_group=quote_name(groups_field.m2m_reverse_name()),
+        user_id=user_id,
+    )
+
+
+def _condition(connection, model, code, lookups):
+    table = connection.ops.quote_name(model._meta.db_table)
+    conditions = []
+    for parameter_name, lookup in sorted(lookups.items()):
+        try:
+            field = model._meta.get_field(lookup)
+        except FieldDoesNotExist:
+            field = None
+        if field is None or not field.concrete or field.many_to_many:
+            raise ImproperlyConfigured('{} of {} is not a column of {}'.format(lookup, code, model._meta.label))
+        # parameter values are stored normalized, so their text equals the column text
+        conditions.append('grants.parameter_values ->> %s = %s.%s::text' % (
+            _literal(parameter_name), table, connection.ops.quote_name(field.column)))
+
+    allowed = "grants.parameter_values = '{}'::jsonb"
+    if conditions:
+        names = ', '.join(_literal(name) for name in sorted(lookups))
+        conditions.append("grants.parameter_values - ARRAY[%s]::text[] = '{}'::jsonb" % names)
+        allowed = '%s OR (%s)' % (allowed, ' AND '.join(conditions))
+    return 'EXISTS (SELECT 1 FROM %s grants WHERE grants.code = %s AND (%s))' % (
+        connection.ops.quote_name(VIEW_NAME), _literal(code), allowed)
+
+
+def policy_name(model):
+    return 'ranger_%s' % model._meta.db_table
+
+
+def other_roles_policy_name(model):
+    return 'ranger_%s_other_roles' % model._meta.db_table
+
+
+def policy_sql(connection, model, permissions_definition, role):
+    """
+    Returns the statements enabling row level security on the table of the
+    given model, with a SELECT policy allowing the members of the given role
+    the rows of its permission definitions, and a policy allowing every row
+    to the other roles.
+    """
+    quote_name = connection.ops.quote_name
+    table = quote_name(model._meta.db_table)
+    name = quote_name(policy_name(model))
+    other_roles_name = quote_name(other_roles_policy_name(model))
+    using = ' OR '.join(_condition(connection, model, code, lookups) for code, lookups in permissions_definition)
+    other_roles = "NOT pg_has_role(%s, 'MEMBER')" % _literal(role)
+    return [
+        'ALTER TABLE %s ENABLE ROW LEVEL SECURITY' % table,
+        'DROP POLICY IF EXISTS %s ON %s' % (name, table),
+        'CREATE POLICY %s ON %s FOR SELECT TO %s USING (%s)' % (name, table, quote_name(role), using or 'false'),
+        'DROP POLICY IF EXISTS %s ON %s' % (other_roles_name, table),
+        'CREATE POLICY %s ON %s FOR ALL TO PUBLIC USING (%s) WITH CHECK (%s)' % (
+            other_roles_name, table, other_roles, other_roles),
+    ]
+
+
+def generate_sql(connection, role, models=None, setting=DEFAULT_SETTING):
+    """
+    Returns the statements of the grants view and the policies of the given
+    registered models, or all of them, restricting the members of the given role.
+    """
+    registered = get_models()
+    statements = [view_sql(connection, setting)]
+    for model in models if models is not None else sorted(registered, key=lambda model: model._meta.label):
+        statements.extend(policy_sql(connection, model, registered[model], role))
+    return statements
@@ -1,11 +1,45 @@
 # Use modern Python
 from __future__ import unicode_literals, absolute_import, print_function
-
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet, ImproperlyConfigured
 from django.utils.functional import cached_property
-from django.db.models import Q, QuerySet
+from django.db import connections, router
+from django.db.models import BooleanField, Case, Q, QuerySet, Value, When
+
+from .models import Permission, UserGrant
+from . import cache as grant_cache, policies
+from .backends import ORMGrantBackend, get_backend
+from .exceptions import DoesNotExist, ParameterError, PermissionNotRevocable
+from .predicates import build_condition
+from .parameters import EMPTY_PARAMETERS_HASH, hash_parameters, normalize_parameters, normalize_value
+from .registry import get_permission
+from .validations import validate_parameters
+
+
+@contextmanager
+def count_queries(using):
+    """
+    Collects the SQL of the queries issued to the `using` database within the
+    block, none without a configured database, e.g. with the in-memory grant backend.
+    """
+    queries = []
+    connection = connections[using]
+    if connection.settings_dict['ENGINE'] == 'django.db.backends.dummy':
+        yield queries
+        return
+
+    def record(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
 
-from .models import Permission, UserGrant, GroupGrant
-from .exceptions import DoesNotExist, PermissionNotRevocable
+    with connection.execute_wrapper(record):
+        yield queries
 
 
 class PermissionManager(object):
@@ -14,44 +48,372 @@ class PermissionManager(object):
 
     It is instantiated with a user instance and enlists all their permissions
      grants to achieve a better performance in multiple permission verifications.
+
+    Grants are read from the `using` database, or the one chosen by the database
+    routers for reading, and written to the one chosen for writing. With
+    `read_your_writes`, the manager reads from the writing database after its
+    first grant or revoke, so it never misses its own writes on a lagging replica.
+
+    When the RANGER_GRANT_CACHE setting is set, the grants are read from and
+    stored in that cache (see `django_ranger.cache`). A missing entry is
+    rebuilt by a single manager at a time, while the others are served its
+    previous version. A manager which wrote grants reads them from the
+    database from then on, since the cache is only invalidated on commit.
+
+    Results of `has_permission` are memoized per permission code and parameter
+    values until the manager grants or revokes a permission. `memo_size` bounds
+    the memoized results, discarding the least recently used ones.
+
+    With `partition_by` set to 'scope' or 'code', or the RANGER_GRANT_PARTITION
+    setting, the grants are loaded lazily by permission scope or code, the first
+    time a check needs them, and each partition is cached on its own.
+
+    Grants are stored by the `backend`, or the one of the RANGER_GRANT_BACKEND
+    setting (see `django_ranger.backends`).
     """
     DoesNotExist = DoesNotExist
     PermissionNotRevocable = PermissionNotRevocable
 
-    def __init__(self, user):
+    # cached properties derived from the loaded grants, cleared when more are loaded
+    _derived_caches = ('_grant_index', '_granted_permissions', 'role_mask', '_fingerprint')
+    # cached properties of the user grants, cleared when they change
+    _grant_caches = ('_grants', '_group_policies', '_own_grants') + _derived_caches
+
+    def __init__(self, user, using=None, read_your_writes=False, memoize=True, memo_size=None, partition_by=None,
+                 backend=None):
         self.user = user
+        self.backend = backend or get_backend()
+        self.using = using
+        self.read_your_writes = read_your_writes
+        self.pinned_to_write_db = False
+        self.memoize = memoize
+        self.memo_size = memo_size
+        self.partition_by = partition_by or getattr(settings, 'RANGER_GRANT_PARTITION', None)
+        if self.partition_by not in (None, 'scope', 'code'):
+            raise ImproperlyConfigured("The grants can only be partitioned by 'scope' or 'code'")
+        self._memo = OrderedDict()
+        self._partitions = {}
+        self._has_written = False
+
+    @property
+    def read_db(self):
+        if self.pinned_to_write_db:
+            return self.write_db
+        return self.using or router.db_for_read(UserGrant, instance=self.user)
+
+    @property
+    def write_db(self):
+        return router.db_for_write(UserGrant, instance=self.user)
 
     @cached_property
     def _grants(self):
-        user_grants = list(self.user.user_grants.select_related('permission').all())
-        group_grants = list(GroupGrant.objects.filter(group__in=self.user.groups.all()).select_related('permission'))
-        return list(map(lambda x: x.to_user_grant(self.user), group_grants)) + user_grants
+        if policies.is_enabled() and isinstance(self.backend, ORMGrantBackend):
+            return self._compose_grants()
+
+        # a manager which wrote grants must not be served, nor cache, another version
+        if not grant_cache.is_enabled() or self._has_written:
+            return self._load_grants()
+
+        grants = grant_cache.get_user_grants(self.user)
+        if grants is None:
+            grants = grant_cache.rebuild_user_grants(self.user, self._load_grants)
+        return grants
+
+    def _load_grants(self):
+        return self._build_grants(self.backend.load_grants(self.user, self.read_db))
+
+    def _build_grants(self, rows):
+        grants = []
+        for code, parameter_values, parameters_hash, source in rows:
+            grant = UserGrant(user=self.user, permission=get_permission(code),
+                              parameter_values=parameter_values, parameters_hash=parameters_hash)
+            grant.source = source
+            grants.append(grant)
+        return grants
+
+    @property
+    def _loaded_grants(self):
+        """
+        The grants loaded so far: every grant, unless they are partitioned and
+        only some partitions were needed.
+        """
+        if self.partition_by is None or '_grants' in self.__dict__:
+            return self._grants
+        return [grant for grants in self._partitions.values() for grant in grants]
+
+    def _require(self, permission):
+        """
+        Loads the partition of grants of the given permission, when the grants
+        are partitioned and it is not loaded yet.
+        """
+        if self.partition_by is None or '_grants' in self.__dict__:
+            return
+
+        name = getattr(permission, self.partition_by)
+        if name in self._partitions:
+            return
+
+        def load():
+            return self._build_grants(self.backend.load_grants(self.user, self.read_db, **{self.partition_by: name}))
+
+        if not grant_cache.is_enabled() or self._has_written:
+            grants = load()
+        else:
+            grants = grant_cache.get_user_partition(self.user, self.partition_by, name)
+            if grants is None:
+                grants = grant_cache.rebuild_user_partition(self.user, self.partition_by, name, load)
+
+        self._partitions[name] = grants
+        for cache_name in self._derived_caches:
+            self.__dict__.pop(cache_name, None)
+
+    def _compose_grants(self):
+        """
+        Returns the user grants followed by the grants of the interned policies
+        of their groups, which are shared with the other members.
+        """
+        if self._has_written:
+            entry = self._load_user_entry()
+        else:
+            entry = grant_cache.get_user_entry(self.user)
+            if entry is None:
+                entry = grant_cache.rebuild_user_entry(self.user, self._load_user_entry)
+        own_grants, group_ids = entry
+
+        self._own_grants = own_grants
+        self._group_policies = policies.get_group_policies(group_ids)
+        return own_grants + [grant for policy in self._group_policies for grant in policy.grants]
+
+    def _load_user_entry(self):
+        db = self.read_db
+        own_grants = list(UserGrant.objects.using(db).filter(user=self.user).select_related('permission'))
+        group_ids = list(self.user.groups.using(db).values_list('pk', flat=True))
+        return own_grants, group_ids
+
+    def _written(self):
+        """
+        Forgets the loaded grants after a write, pinning the manager to the
+        writing database when `read_your_writes` is enabled.
+        """
+        self._has_written = True
+        if self.read_your_writes:
+            self.pinned_to_write_db = True
+        grant_cache.invalidate_users([self.user.pk], using=self.write_db)
+        for name in self._grant_caches:
+            self.__dict__.pop(name, None)
+        self._partitions.clear()
+        self._memo.clear()
 
-    def get_grants(self):
-        return self._grants
+    @cached_property
+    def _grant_index(self):
+        """
+        Maps each granted permission code to the set of hashes of its granted parameter values.
+        """
+        grants = self._loaded_grants
+        if '_group_policies' not in self.__dict__:
+            index = {}
+            for grant in grants:
+                index.setdefault(grant.permission.code, set()).add(grant.parameters_hash)
+            return index
+
+        # the indexes of the group policies are already compiled
+        index = {}
+        for policy in self._group_policies:
+            for code, hashes in policy.index.items():
+                index[code] = index[code] | hashes if code in index else hashes
+        for grant in self._own_grants:
+            index[grant.permission.code] = index.get(grant.permission.code, frozenset()) | {grant.parameters_hash}
+        return index
+
+    @cached_property
+    def _granted_permissions(self):
+        """
+        Maps each granted permission code to its permission.
+        """
+        return {grant.permission.code: grant.permission for grant in self._loaded_grants}
+
+    @cached_property
+    def role_mask(self):
+        """
+        A bitmask of the permissions granted without parameters, by their `bit_position`.
+        """
+        mask = 0
+        for grant in self._loaded_grants:
+            if grant.parameters_hash == EMPTY_PARAMETERS_HASH and grant.permission.bit_position is not None:
+                mask |= grant.permission.bit
+        return mask
+
+    def get_grants(self, codes=None):
+        """
+        Returns the effective grants of the user, or only those of the given
+        permission codes, which only loads their partitions of grants.
+        """
+        if codes is None:
+            if self.partition_by is not None and '_grants' not in self.__dict__:
+                for cache_name in self._derived_caches:
+                    self.__dict__.pop(cache_name, None)
+            return self._grants
+
+        codes = set(codes)
+        for code in codes if self.partition_by is not None else ():
+            try:
+                self._require(get_permission(code))
+            except Permission.DoesNotExist:
+                pass
+        return [grant for grant in self._loaded_grants if grant.permission.code in codes]
+
+    @cached_property
+    def _fingerprint(self):
+        return self._compute_fingerprint(self._grant_index)
+
+    def fingerprint(self, codes=None):
+        """
+        Returns a stable fingerprint of the effective grants, optionally
+        restricted to the given permission codes. Users with the same grants
+        have the same fingerprint, whether they come from users or groups.
+        """
+        if codes is None:
+            self.get_grants()
+            return self._fingerprint
+        codes = set(codes)
+        self.get_grants(codes)
+        return self._compute_fingerprint({code: hashes for code, hashes in self._grant_index.items() if code in codes})
+
+    @staticmethod
+    def _compute_fingerprint(grant_index):
+        data = json.dumps(sorted((code, sorted(hashes)) for code, hashes in grant_index.items()), separators=(',', ':'))
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()[:32]
 
     def has_permission(self, action_name, **parameter_values):
         """
         Verifies if the instantiated user has the given permission with
         the given parameters.
+
+        The parameter values are normalized to the permission parameter types,
+        so `store_id="42"` and `store_id=42` are the same check for an int parameter.
         """
-        permission = Permission.objects.get(code=action_name)
-        expected_grant = UserGrant(permission=permission, parameter_values=parameter_values)
-        for grant in self._grants:
-            if grant.complies(expected_grant):
-                return True
+        if not self.memoize:
+            return self._check_permission(action_name, parameter_values)
+
+        try:
+            # values are tagged with their type, so True and 1 are different keys
+            key = (action_name, frozenset((name, type(value), value) for name, value in parameter_values.items()))
+            result = self._memo[key]
+        except TypeError:
+            # unhashable parameter values are not memoized
+            return self._check_permission(action_name, parameter_values)
+        except KeyError:
+            result = self._memo[key] = self._check_permission(action_name, parameter_values)
+            if self.memo_size is not None and len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        else:
+            if self.memo_size is not None:
+                self._memo.move_to_end(key)
+        return result
+
+    def _check_permission(self, action_name, parameter_values):
+        permission = get_permission(action_name)
+        self._require(permission)
+        if permission.bit_position is not None and self.role_mask & permission.bit:
+            return True
+
+        granted_hashes = self._grant_index.get(permission.code, ())
+        if EMPTY_PARAMETERS_HASH in granted_hashes:
+            return True
+
+        try:
+            parameter_values = normalize_parameters(permission.parameter_types, parameter_values)
+        except ParameterError:
+            # a value that can not be normalized can not be granted
+            return False
+        return hash_parameters(parameter_values) in granted_hashes
+
+    def explain(self, action_name, **parameter_values):
+        """
+        Checks the given permission like `has_permission`, without the memoized
+        results, and returns how it was decided:
 
-        return False
+        {'code': 'can_manage:store', 'parameter_values': {'store_id': 1},
+         'granted': True, 'grants': [<UserGrant>], 'sources': ['group'],
+         'strategy': 'hash_index', 'grants_scanned': 3, 'queries': 1, 'elapsed': 0.0004}
+
+        The strategy is 'role_mask' when a grant without parameters is found in
+        the role mask, 'hash_index' when the parameter values are looked up in
+        the granted hashes, or 'invalid_parameters' when they can not be normalized.
+        The queries are those issued to load the grants, if they were not loaded yet.
+        """
+        start = time.perf_counter()
+        with count_queries(self.read_db) as queries:
+            permission = get_permission(action_name)
+            self._require(permission)
+            grants = [grant for grant in self._loaded_grants if grant.permission.code == permission.code]
+
+            try:
+                normalized_values = normalize_parameters(permission.parameter_types, parameter_values)
+            except ParameterError:
+                normalized_values = None
+
+            if permission.bit_position is not None and self.role_mask & permission.bit:
+                strategy = 'role_mask'
+                hashes = {EMPTY_PARAMETERS_HASH}
+            elif normalized_values is None:
+                strategy = 'invalid_parameters'
+                hashes = set()
+            else:
+                strategy = 'hash_index'
+                hashes = {EMPTY_PARAMETERS_HASH, hash_parameters(normalized_values)}
+            matching_grants = [grant for grant in grants if grant.parameters_hash in hashes]
+
+        return {
+            'code': permission.code,
+            'parameter_values': parameter_values if normalized_values is None else normalized_values,
+            'granted': bool(matching_grants),
+            'grants': matching_grants,
+            'sources': sorted({grant.source for grant in matching_grants}),
+            'strategy': strategy,
+            'grants_scanned': len(grants),
+            'queries': len(queries),
+            'elapsed': time.perf_counter() - start,
+        }
+
+    def allowed_values(self, action_name, parameter_name, candidates):
+        """
+        Returns the candidates for which the instantiated user has the given
+        permission, as if `has_permission(action_name, **{parameter_name: value})`
+        were called for each one of them. A grant without parameters allows
+        every candidate.
+
+        e.g:
+        allowed_values('can_manage:store', 'store_id', [1, 2, 3]) -> [1, 3]
+        """
+        self._require(get_permission(action_name))
+        granted_hashes = self._grant_index.get(action_name)
+        if not granted_hashes:
+            return []
+
+        if EMPTY_PARAMETERS_HASH in granted_hashes:
+            return list(candidates)
+
+        parameter_type = self._granted_permissions[action_name].parameter_types.get(parameter_name)
+        allowed = []
+        for value in candidates:
+            try:
+                normalized_value = value if parameter_type is None else normalize_value(parameter_type, value)
+            except ParameterError:
+                continue
+            if hash_parameters({parameter_name: normalized_value}) in granted_hashes:
+                allowed.append(value)
+        return allowed
 
     def grant_permission(self, action_name, **parameter_values):
         """
         Creates an UserGrant for the instanced user with the given permission.
         If the grant already exists, this method does nothing.
         """
-        permission = Permission.objects.get(code=action_name)
-        query = Q(user=self.user, permission=permission) & (Q(parameter_values=parameter_values) | Q(parameter_values={}))
-        if not UserGrant.objects.filter(query).exists():
-            UserGrant.objects.create(permission=permission, user=self.user, parameter_values=parameter_values)
+        permission = get_permission(action_name)
+        parameter_values = validate_parameters(permission, parameter_values)
+        self.backend.grant(self.user, permission, parameter_values, using=self.write_db)
+        self._written()
 
     def revoke_permission(self, action_name, **parameter_values):
         """
@@ -62,11 +424,18 @@ class PermissionManager(object):
         But if the user has this permission from a different way (e.g through GroupGrant or permission without params),
         it raise a PermissionNotRevocable exception.
         """
-        permission = Permission.objects.get(code=action_name)
-        user_grant = UserGrant.objects.filter(user=self.user, permission=permission, parameter_values=parameter_values)
-        if user_grant.exists():
-            user_grant.delete()
-        elif not self.has_permission(action_name, **parameter_values):
+        permission = get_permission(action_name)
+        try:
+            normalized_values = normalize_parameters(permission.parameter_types, parameter_values)
+        except ParameterError:
+            raise self.DoesNotExist("Permission {} does not granted".format(permission.code))
+
+        deleted = self.backend.revoke(self.user, permission, normalized_values, using=self.write_db)
+        self._written()
+        if deleted:
+            return
+
+        if not self.has_permission(action_name, **parameter_values):
             raise self.DoesNotExist("Permission {} does not granted".format(permission.code))
         else:
             raise self.PermissionNotRevocable("Permission {} does not granted".format(permission.code))
@@ -76,8 +445,11 @@ class PermissionManager(object):
         Receive a list of tuple's with their action_name and parameters values
         e.g:
         [('can_view:module', {'module_id': 1}), ('can_manage:module', {'module_id': 12})]
-        """
 
+        The actions are checked in order, each against the `role_mask` before
+        its parameters, and the checks stop at the first granted action. So
+        the later actions are neither resolved nor their grants loaded.
+        """
         for action_name, parameter_values in action_list:
             if self.has_permission(action_name, **parameter_values):
                 return True
@@ -85,6 +457,32 @@ class PermissionManager(object):
         return False
 
 
+def get_user_ids_with_permission(action_name, using=None, backend=None, **parameter_values):
+    """
+    Returns the set of ids of the users which have the given permission with
+    the given parameters, directly, through their groups or without parameters.
+    """
+    permission = get_permission(action_name)
+    try:
+        parameter_values = normalize_parameters(permission.parameter_types, parameter_values)
+    except ParameterError:
+        return set()
+    backend = backend or get_backend()
+    return backend.get_user_ids(permission, parameter_values, using=using or router.db_for_read(UserGrant))
+
+
+def get_permission_manager(request):
+    """
+    Returns the PermissionManager of the request user, created once per request,
+    so every check of the request shares the loaded grants and their role mask.
+    """
+    permission_manager = getattr(request, '_ranger_permission_manager', None)
+    if permission_manager is None or permission_manager.user != request.user:
+        permission_manager = PermissionManager(request.user)
+        request._ranger_permission_manager = permission_manager
+    return permission_manager
+
+
 class RangerQuerySet(QuerySet):
     """
     This is a reimplementation of QuerySet to make querying filtering by user grants.
@@ -95,6 +493,14 @@ class RangerQuerySet(QuerySet):
 
     Returns a RangerQuerySet filtered by the requested permissions
 
+    The permission filter is added to the query once, the first time the query
+    is used, and it is carried by every clone. So chained methods, `count()`,
+    `exists()`, `values()` or `iterator(chunk_size=...)` are all evaluated by the
+    database with the filter applied.
+
+    The granted values of each lookup are matched with a strategy chosen from
+    their number (see `django_ranger.predicates`), which `predicate_strategies`
+    tells for debugging.
     """
 
     def __init__(self, model, permission_manager=None, permissions_definition=list, query=None, *args, **kwargs):
@@ -104,74 +510,204 @@ class RangerQuerySet(QuerySet):
             query = queryset.query.clone()
 
         self.is_filtered_by_permission = False
+        self._predicate_strategies = {}
         self.permission_manager = permission_manager
         self.permissions_definition = permissions_definition
         super(RangerQuerySet, self).__init__(model, query, *args, **kwargs)
 
-    def all(self):
-        """
-        Returns a new QuerySet that is a copy of the current one. This allows a
-        QuerySet to proxy for a model manager in some cases.
-        """
-        clone = self._clone()
-        if not self.is_filtered_by_permission:
-            clone = self._filtered_by_permissions(clone)
+    @property
+    def query(self):
+        query = QuerySet.query.fget(self)
+        if not self.is_filtered_by_permission and self.permission_manager is not None:
             self.is_filtered_by_permission = True
-        return clone
+            try:
+                self._filter_by_permissions(query)
+            except Exception:
+                # the next evaluation must build the filter again, never run without it
+                self.is_filtered_by_permission = False
+                raise
+        return query
 
-    def filter(self, *args, **kwargs):
-        clone = super(RangerQuerySet, self).filter(*args, **kwargs)
-        if not self.is_filtered_by_permission:
-            clone = self._filtered_by_permissions(clone)
-            self.is_filtered_by_permission = True
+    @query.setter
+    def query(self, value):
+        QuerySet.query.fset(self, value)
+
+    def _clone(self):
+        clone = super(RangerQuerySet, self)._clone()
+        clone.is_filtered_by_permission = self.is_filtered_by_permission
+        clone._predicate_strategies = self._predicate_strategies
+        clone.permission_manager = self.permission_manager
+        clone.permissions_definition = self.permissions_definition
         return clone
 
-    def _filtered_by_permissions(self, clone):
+    @property
+    def predicate_strategies(self):
         """
-        Returns a new QuerySet instance filtered by the user permissions.
+        The strategy of the permission filter for each lookup, or tuple of
+        lookups, e.g: {'store_id': 'in'}. It is empty when the filter allows
+        every row or none.
+        """
+        self.query
+        return self._predicate_strategies
+
+    def explain_permissions(self):
+        """
+        Builds the permission filter of this QuerySet again and returns how:
+
+        {'grants': [<UserGrant>], 'sources': ['user'], 'strategies': {'store_id': 'in'},
+         'unrestricted': False, 'empty': False, 'grants_scanned': 12, 'queries': 0,
+         'elapsed': 0.0002, 'sql': 'SELECT ...'}
+
+        `grants` are those applied to the filter, `unrestricted` tells if one of
+        them has no parameters, so the filter allows every row, and `empty` if
+        there are none. The queries are those issued to load the grants, if they
+        were not loaded yet.
+        """
+        manager = self.permission_manager
+        codes = [code for code, lookups in self.permissions_definition]
+        start = time.perf_counter()
+        with count_queries(manager.read_db) as queries:
+            loaded_grants = manager.get_grants(codes)
+            grants = [grant for grant in loaded_grants if grant.complies_any(self.permissions_definition)]
+            queryset = RangerQuerySet(self.model, manager, self.permissions_definition, using=self._db)
+            strategies = queryset.predicate_strategies
+        elapsed = time.perf_counter() - start
+
+        try:
+            sql = str(self.query)
+        except EmptyResultSet:
+            sql = None
+
+        return {
+            'grants': grants,
+            'sources': sorted({grant.source for grant in grants}),
+            'strategies': strategies,
+            'unrestricted': any(grant.parameter_values == {} for grant in grants),
+            'empty': not grants,
+            'grants_scanned': len(loaded_grants),
+            'queries': len(queries),
+            'elapsed': elapsed,
+            'sql': sql,
+        }
+
+    def cache_key(self, prefix='ranger:queryset'):
+        """
+        Returns a key to cache the results of this QuerySet, shared by the
+        users whose grants for the permissions of `permissions_definition` are the same.
+        """
+        try:
+            sql, params = self.query.sql_with_params()
+            statement = '%s %r' % (sql, params)
+        except EmptyResultSet:
+            statement = 'empty'
+
+        fingerprint = self.permission_manager.fingerprint(code for code, lookups in self.permissions_definition)
+        digest = hashlib.md5(statement.encode('utf-8')).hexdigest()
+        return '%s:%s:%s:%s' % (prefix, self.model._meta.label_lower, fingerprint, digest)
+
+    def annotate_permissions(self, permissions):
+        """
+        Returns a new QuerySet with a boolean column for each given permission,
+        computed in SQL from the user grants, which tells if the user has the
+        permission over each row.
+
+        The `permissions` param expect a dict of annotation names and permission codes:
+
+        {'can_edit': 'can_manage:store', 'can_delete': 'can_delete:store'}
+
+        The parameters of each permission are mapped to fields using the
+        lookups of `permissions_definition`, or the parameter names when the
+        permission is not defined there.
+        """
+        annotations = {}
+        for name, action_name in permissions.items():
+            annotations[name] = self._permission_expression(action_name)
+        return self.annotate(**annotations)
+
+    def _permission_expression(self, action_name):
+        """
+        Returns a boolean expression which is true for the rows allowed by the
+        user grants of the given permission.
+        """
+        lookups = dict(self.permissions_definition).get(action_name, {})
+        params_list = []
+        for grant in self.permission_manager.get_grants([action_name]):
+            if grant.permission.code != action_name:
+                continue
+
+            if grant.parameter_values == {}:
+                # a permission without params allows every row
+                return Value(True, output_field=BooleanField())
+
+            try:
+                parameter_values = normalize_parameters(grant.permission.parameter_types, grant.parameter_values)
+            except ParameterError:
+                # a grant stored before its parameter types can not match, like in has_permission
+                continue
+            params_list.append({lookups.get(key, key): value for key, value in parameter_values.items()})
+
+        if not params_list:
+            return Value(False, output_field=BooleanField())
+
+        condition, strategies = build_condition(self.model, params_list)
+        return Case(When(condition, then=Value(True)), default=Value(False), output_field=BooleanField())
+
+    def _filter_by_permissions(self, query):
+        """
+        Filters the given query by the user permissions.
         """
 
         # obtains the needed grant for this query.
-        grants = list(filter(lambda x: x.complies_any(self.permissions_definition), self.permission_manager.get_grants()))
-        if not grants:
-            return self.none()
+        grants = list(filter(lambda x: x.complies_any(self.permissions_definition), self.permission_manager.get_grants(code for code, lookups in self.permissions_definition)))
+        condition = self._create_query(grants) if grants else None
+        if condition is None:
+            query.set_empty()
+            return
 
-        query = self._create_query(grants)
-        clone.query.add_q(query)
-        return clone
+        query.add_q(condition)
 
     def _create_query(self, grants):
         """
-        Returns a Query expression built off the user grants.
+        Returns a Query expression built off the user grants, or None when
+        none of them can match.
         """
-        query_list = []
+        params_list = []
 
         for grant in filter(lambda x: x.complies_any(self.permissions_definition), grants):
             params = self._convert_to_dict_query(grant)
 
+            if params is None:
+                continue
+
             if params == {}:
                 # if exists a permission without params, the other permissions are ignored
+                self._predicate_strategies = {}
                 return Q(**params)
 
-            query_list.append(Q(**params))
+            params_list.append(params)
 
-        query = query_list.pop()
-        for item_query in query_list:
-            query = query | item_query
+        if not params_list:
+            return None
 
+        query, self._predicate_strategies = build_condition(self.model, params_list)
         return query
 
     def _convert_to_dict_query(self, grant):
         """
         Returns a dict that can be passed by params to the .filter() method
-        for make querying.
+        for make querying, or None when the grant values can not be normalized.
         """
         action = list(filter(lambda x: grant.complies_any([x]), self.permissions_definition))[0]
         lookups = action[1]
+        try:
+            parameter_values = normalize_parameters(grant.permission.parameter_types, grant.parameter_values)
+        except ParameterError:
+            # a grant stored before its parameter types can not match, like in has_permission
+            return None
         params = {}
-        for key in grant.parameter_values.keys():
+        for key in parameter_values.keys():
             lookup_key = lookups.get(key, key)
-            params[lookup_key] = grant.parameter_values[key]
+            params[lookup_key] = parameter_values[key]
 
         return params
 
@@ -0,0 +1,86 @@
+from django import template
+
+from ..services import get_permission_manager
+
+register = template.Library()
+
+
+def _get_permission_manager(context):
+    """
+    Returns the request-scoped PermissionManager of the template context, from
+    the `permissions` context processor or the request, or None when the user
+    is anonymous.
+    """
+    if 'ranger_permissions' in context:
+        return context['ranger_permissions']
+
+    request = context.get('request')
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None
+    return get_permission_manager(request)
+
+
+def _has_permission(context, action_name, parameter_values):
+    permission_manager = _get_permission_manager(context)
+    if permission_manager is None:
+        return False
+    return permission_manager.has_permission(action_name, **parameter_values)
+
+
+@register.simple_tag(takes_context=True)
+def ranger_has_perm(context, action_name, **parameter_values):
+    """
+    Returns if the request user has the given permission:
+
+    {% ranger_has_perm "can_manage:store" store_id=store.id as can_manage %}
+    """
+    return _has_permission(context, action_name, parameter_values)
+
+
+class RangerAllowedNode(template.Node):
+
+    def __init__(self, action_name, parameter_values, nodelist_allowed, nodelist_denied):
+        self.action_name = action_name
+        self.parameter_values = parameter_values
+        self.nodelist_allowed = nodelist_allowed
+        self.nodelist_denied = nodelist_denied
+
+    def render(self, context):
+        action_name = self.action_name.resolve(context)
+        parameter_values = {key: value.resolve(context) for key, value in self.parameter_values.items()}
+        if _has_permission(context, action_name, parameter_values):
+            return self.nodelist_allowed.render(context)
+        return self.nodelist_denied.render(context)
+
+
+@register.tag
+def ranger_allowed(parser, token):
+    """
+    Renders its content when the request user has the given permission:
+
+    {% ranger_allowed "can_manage:store" store_id=store.id %}
+        <a href="...">Edit</a>
+    {% else %}
+        Read only
+    {% endranger_allowed %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError("'%s' takes at least one argument, the permission code" % bits[0])
+
+    action_name = parser.compile_filter(bits[1])
+    remaining_bits = bits[2:]
+    parameter_values = template.base.token_kwargs(remaining_bits, parser, support_legacy=False)
+    if remaining_bits:
+        raise template.TemplateSyntaxError("'%s' received invalid arguments: %s" % (bits[0], ' '.join(remaining_bits)))
+
+    nodelist_allowed = parser.parse(('else', 'endranger_allowed'))
+    token = parser.next_token()
+    if token.contents == 'else':
+        nodelist_denied = parser.parse(('endranger_allowed',))
+        parser.delete_first_token()
+    else:
+        nodelist_denied = template.NodeList()
+
+    return RangerAllowedNode(action_name, parameter_values, nodelist_allowed, nodelist_denied)
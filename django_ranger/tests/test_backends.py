@@ -0,0 +1,164 @@
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from model_mommy import mommy
+
+from .. import registry
+from ..backends import InMemoryGrantBackend, ORMGrantBackend, get_backend
+from ..models import Permission
+from ..services import PermissionManager, get_user_ids_with_permission
+
+
+class GrantBackendTestMixin(object):
+
+    def setUp(self):
+        self.user = mommy.make(settings.AUTH_USER_MODEL)
+        self.other_user = mommy.make(settings.AUTH_USER_MODEL)
+        self.group = mommy.make("auth.Group")
+        self.can_view_code = "can_view:module"
+        self.can_manage_code = "can_manage:module"
+        self.can_view_permission = mommy.make("django_ranger.Permission", code=self.can_view_code, scope="module")
+        self.can_manage_permission = mommy.make("django_ranger.Permission", code=self.can_manage_code, scope="module",
+                                                parameters_definition=["module_id"],
+                                                parameter_types={"module_id": "int"})
+        registry.preload_permissions()
+        self.backend = self.get_backend()
+
+    def manager(self, user):
+        return PermissionManager(user, backend=self.backend)
+
+    def test_grant_and_revoke(self):
+        self.manager(self.user).grant_permission(self.can_manage_code, module_id=1)
+        self.manager(self.user).grant_permission(self.can_manage_code, module_id="1")
+
+        user_permission = self.manager(self.user)
+        self.assertEqual(len(user_permission.get_grants()), 1)
+        self.assertTrue(user_permission.has_permission(self.can_manage_code, module_id=1))
+        self.assertFalse(user_permission.has_permission(self.can_manage_code, module_id=2))
+        self.assertFalse(self.manager(self.other_user).has_permission(self.can_manage_code, module_id=1))
+
+        user_permission.revoke_permission(self.can_manage_code, module_id="1")
+        self.assertFalse(user_permission.has_permission(self.can_manage_code, module_id=1))
+        with self.assertRaises(PermissionManager.DoesNotExist):
+            user_permission.revoke_permission(self.can_manage_code, module_id=1)
+
+    def test_group_grants(self):
+        self.add_to_group(self.user, self.group)
+        self.grant_group(self.group, self.can_manage_permission, {"module_id": 1})
+        self.manager(self.user).grant_permission(self.can_manage_code, module_id=1)
+
+        user_permission = self.manager(self.user)
+        self.assertEqual([(grant.parameter_values, grant.source) for grant in user_permission.get_grants()],
+                         [({"module_id": 1}, "user")])
+
+        user_permission.revoke_permission(self.can_manage_code, module_id=1)
+        self.assertEqual([grant.source for grant in user_permission.get_grants()], ["group"])
+        with self.assertRaises(PermissionManager.PermissionNotRevocable):
+            user_permission.revoke_permission(self.can_manage_code, module_id=1)
+
+    def test_load_many_grants(self):
+        self.add_to_group(self.user, self.group)
+        self.grant_group(self.group, self.can_manage_permission, {"module_id": 1})
+        self.manager(self.user).grant_permission(self.can_manage_code, module_id=1)
+        self.manager(self.other_user).grant_permission(self.can_view_code)
+
+        grants_by_user = self.backend.load_many_grants([self.user.pk, self.other_user.pk], "default")
+        self.assertEqual(grants_by_user[self.user.pk], self.backend.load_grants(self.user, "default"))
+        self.assertEqual([row[3] for row in grants_by_user[self.user.pk]], ["user"])
+        self.assertEqual(grants_by_user[self.other_user.pk], self.backend.load_grants(self.other_user, "default"))
+
+    def test_grant_without_parameters(self):
+        self.manager(self.user).grant_permission(self.can_manage_code)
+        self.manager(self.user).grant_permission(self.can_manage_code, module_id=1)
+
+        user_permission = self.manager(self.user)
+        self.assertEqual(len(user_permission.get_grants()), 1)
+        self.assertTrue(user_permission.has_permission(self.can_manage_code, module_id=2))
+
+    def test_partitions(self):
+        self.manager(self.user).grant_permission(self.can_view_code)
+
+        user_permission = PermissionManager(self.user, backend=self.backend, partition_by="code")
+        self.assertTrue(user_permission.has_permission(self.can_view_code))
+        self.assertFalse(user_permission.has_permission(self.can_manage_code, module_id=1))
+
+    def test_get_user_ids(self):
+        self.add_to_group(self.other_user, self.group)
+        self.grant_group(self.group, self.can_manage_permission, {"module_id": 1})
+        self.manager(self.user).grant_permission(self.can_manage_code, module_id=2)
+        self.manager(self.user).grant_permission(self.can_view_code)
+
+        def get_user_ids(code, **parameter_values):
+            return get_user_ids_with_permission(code, backend=self.backend, **parameter_values)
+
+        self.assertEqual(get_user_ids(self.can_manage_code, module_id="1"), {self.other_user.pk})
+        self.assertEqual(get_user_ids(self.can_manage_code, module_id=2), {self.user.pk})
+        self.assertEqual(get_user_ids(self.can_manage_code, module_id="x"), set())
+        self.assertEqual(get_user_ids(self.can_view_code), {self.user.pk})
+
+
+class ORMGrantBackendTestCase(GrantBackendTestMixin, TestCase):
+
+    def get_backend(self):
+        return ORMGrantBackend()
+
+    def add_to_group(self, user, group):
+        user.groups.add(group)
+
+    def grant_group(self, group, permission, parameter_values):
+        mommy.make("django_ranger.GroupGrant", group=group, permission=permission, parameter_values=parameter_values)
+
+
+class InMemoryGrantBackendTestCase(GrantBackendTestMixin, TestCase):
+
+    def get_backend(self):
+        return InMemoryGrantBackend()
+
+    def add_to_group(self, user, group):
+        self.backend.add_to_group(user, group)
+
+    def grant_group(self, group, permission, parameter_values):
+        self.backend.grant_group(group, permission, parameter_values)
+
+    def test_does_not_use_the_database_for_grants(self):
+        self.backend.grant_group(self.group, self.can_view_permission, {})
+        self.backend.add_to_group(self.user, self.group)
+
+        with self.assertNumQueries(0):
+            user_permission = self.manager(self.user)
+            user_permission.grant_permission(self.can_manage_code, module_id=1)
+            self.assertTrue(user_permission.has_permission(self.can_view_code))
+            self.assertTrue(user_permission.has_permission(self.can_manage_code, module_id=1))
+
+        self.backend.remove_from_group(self.user, self.group)
+        self.assertFalse(self.manager(self.user).has_permission(self.can_view_code))
+
+    def test_permissions_from_definitions_without_database(self):
+        registry.register("can_edit:module", scope="module", parameters={"module_id": "int"})
+        self.addCleanup(registry.unregister, "can_edit:module")
+        self.addCleanup(registry.clear_permissions)
+
+        with mock.patch.object(registry, '_has_database', return_value=False), self.assertNumQueries(0):
+            registry.clear_permissions()
+            user_permission = self.manager(self.user)
+            user_permission.grant_permission("can_edit:module", module_id="1")
+            self.assertTrue(user_permission.has_permission("can_edit:module", module_id=1))
+            with self.assertRaises(Permission.DoesNotExist):
+                user_permission.has_permission("can_delete:module")
+
+    def test_explain_without_database(self):
+        self.backend.grant(self.user, self.can_view_permission, {}, using=None)
+
+        # the dummy backend of Django, when no database is configured, raises on any use
+        with mock.patch.dict(connection.settings_dict, {'ENGINE': 'django.db.backends.dummy'}), \
+                mock.patch.object(connection, 'ensure_connection', side_effect=AssertionError):
+            explanation = self.manager(self.user).explain(self.can_view_code)
+        self.assertTrue(explanation['granted'])
+        self.assertEqual(explanation['queries'], 0)
+
+    @override_settings(RANGER_GRANT_BACKEND='django_ranger.backends.InMemoryGrantBackend')
+    def test_backend_setting(self):
+        self.assertIsInstance(get_backend(), InMemoryGrantBackend)
+        self.assertIs(PermissionManager(self.user).backend, get_backend())
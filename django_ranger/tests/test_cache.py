@@ -0,0 +1,226 @@
+from io import StringIO
+from threading import Barrier, Thread
+from time import sleep
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from model_mommy import mommy
+
+from .. import cache, registry
+from ..models import GroupGrant, UserGrant
+from ..services import PermissionManager
+
+
+@override_settings(RANGER_GRANT_CACHE='default')
+class GrantCacheTestCase(TestCase):
+
+    def setUp(self):
+        cache.connect_signals()
+        cache.get_cache().clear()
+        self.user = mommy.make(settings.AUTH_USER_MODEL)
+        self.group = mommy.make("auth.Group")
+        self.user.groups.add(self.group)
+        self.can_view_code = "can_view:module"
+        self.can_manage_code = "can_manage:module"
+        self.can_view_permission = mommy.make("django_ranger.Permission", code=self.can_view_code)
+        self.can_manage_permission = mommy.make("django_ranger.Permission",
+                                                code=self.can_manage_code,
+                                                parameters_definition=["module_id"])
+        mommy.make("django_ranger.GroupGrant", group=self.group,
+                   permission=self.can_manage_permission,
+                   parameter_values={"module_id": 1})
+
+    def tearDown(self):
+        cache.disconnect_signals()
+
+    def test_cached_grants(self):
+        self.assertTrue(PermissionManager(self.user).has_permission(self.can_manage_code, module_id=1))
+
+        with self.assertNumQueries(0):
+            user_permission = PermissionManager(self.user)
+            self.assertTrue(user_permission.has_permission(self.can_manage_code, module_id=1))
+            self.assertFalse(user_permission.has_permission(self.can_view_code))
+
+    def test_cached_grants_invalidation(self):
+        self.assertFalse(PermissionManager(self.user).has_permission(self.can_view_code))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mommy.make("django_ranger.GroupGrant", group=self.group, permission=self.can_view_permission)
+        self.assertTrue(PermissionManager(self.user).has_permission(self.can_view_code))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.remove(self.group)
+        self.assertFalse(PermissionManager(self.user).has_permission(self.can_view_code))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PermissionManager(self.user).grant_permission(self.can_view_code)
+        self.assertTrue(PermissionManager(self.user).has_permission(self.can_view_code))
+
+    def test_invalidation_on_update(self):
+        registry.preload_permissions()
+        user_grant = mommy.make("django_ranger.UserGrant", user=self.user, permission=self.can_view_permission)
+        self.assertTrue(PermissionManager(self.user).has_permission(self.can_manage_code, module_id=1))
+        self.assertTrue(PermissionManager(self.user).has_permission(self.can_view_code))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            GroupGrant.objects.filter(group=self.group).update(parameter_values={"module_id": 2})
+        self.assertFalse(PermissionManager(self.user).has_permission(self.can_manage_code, module_id=1))
+        self.assertTrue(PermissionManager(self.user).has_permission(self.can_manage_code, module_id=2))
+
+        other_user = mommy.make(settings.AUTH_USER_MODEL)
+        self.assertFalse(PermissionManager(other_user).has_permission(self.can_view_code))
+        with self.captureOnCommitCallbacks(execute=True):
+            UserGrant.objects.filter(pk=user_grant.pk).update(user=other_user)
+        self.assertFalse(PermissionManager(self.user).has_permission(self.can_view_code))
+        self.assertTrue(PermissionManager(other_user).has_permission(self.can_view_code))
+
+    def test_invalidation_on_commit(self):
+        self.assertFalse(PermissionManager(self.user).has_permission(self.can_view_code))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user_permission = PermissionManager(self.user)
+            user_permission.grant_permission(self.can_view_code)
+            # the cached grants are kept until the grant is committed, but not used by its writer
+            self.assertFalse(PermissionManager(self.user).has_permission(self.can_view_code))
+            self.assertTrue(user_permission.has_permission(self.can_view_code))
+
+        self.assertTrue(PermissionManager(self.user).has_permission(self.can_view_code))
+
+    def test_rebuild_before_invalidation_is_ignored(self):
+        key = cache.grants_key(self.user.pk)
+
+        def load():
+            # the grants change while they are loaded
+            cache._invalidate_users([self.user.pk])
+            return ["previous grants"]
+
+        self.assertEqual(cache.rebuild(key, load, list, lambda data: data), ["previous grants"])
+        self.assertIsNone(cache.get_entry(key))
+        self.assertIsNone(cache.get_user_grants(self.user))
+
+    def test_rebuild_keeps_lock_of_other_owner(self):
+        key = "ranger:test"
+
+        def load():
+            # the lock expired and another caller took it
+            cache.get_cache().set(cache.lock_key(key), "other owner")
+            return ["grants"]
+
+        cache.rebuild(key, load, list, lambda data: data)
+        self.assertEqual(cache.get_cache().get(cache.lock_key(key)), "other owner")
+
+    def test_cached_partitions(self):
+        self.can_manage_permission.scope = "module"
+        self.can_manage_permission.save()
+        registry.preload_permissions()
+        self.assertTrue(PermissionManager(self.user, partition_by="scope").has_permission(self.can_manage_code, module_id=1))
+
+        with self.assertNumQueries(0):
+            self.assertTrue(PermissionManager(self.user, partition_by="scope").has_permission(self.can_manage_code, module_id=1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mommy.make("django_ranger.GroupGrant", group=self.group,
+                       permission=self.can_manage_permission,
+                       parameter_values={"module_id": 2})
+        self.assertTrue(PermissionManager(self.user, partition_by="scope").has_permission(self.can_manage_code, module_id=2))
+
+    def test_warm_grants(self):
+        other_user = mommy.make(settings.AUTH_USER_MODEL)
+        mommy.make("django_ranger.UserGrant", user=other_user, permission=self.can_view_permission)
+
+        stdout = StringIO()
+        call_command("ranger_warm_grants", chunk_size=1, stdout=stdout)
+        self.assertIn("Warmed 2 users", stdout.getvalue())
+
+        registry.preload_permissions()
+
+        with self.assertNumQueries(0):
+            self.assertTrue(PermissionManager(self.user).has_permission(self.can_manage_code, module_id=1))
+            self.assertTrue(PermissionManager(other_user).has_permission(self.can_view_code))
+
+    def test_warm_grants_like_permission_manager(self):
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_manage_permission,
+                   parameter_values={"module_id": 1})
+        registry.preload_permissions()
+        self.assertTrue(PermissionManager(self.user).has_permission(self.can_manage_code, module_id=1))
+        loaded = cache.get_cache().get(cache.grants_key(self.user.pk))[1]
+
+        cache.get_cache().clear()
+        call_command("ranger_warm_grants", stdout=StringIO())
+        # the grant given both to the user and their group is cached once, as a user grant
+        self.assertEqual(cache.get_cache().get(cache.grants_key(self.user.pk))[1], loaded)
+        self.assertEqual([grant.source for grant in cache.get_user_grants(self.user)], ["user"])
+
+    def test_rebuild_serves_stale_grants(self):
+        self.assertTrue(PermissionManager(self.user).has_permission(self.can_manage_code, module_id=1))
+        registry.preload_permissions()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mommy.make("django_ranger.GroupGrant", group=self.group, permission=self.can_view_permission)
+        key = cache.grants_key(self.user.pk)
+        # another request is rebuilding the grants of the user
+        cache.get_cache().add(cache.lock_key(key), True)
+
+        with self.assertNumQueries(0):
+            user_permission = PermissionManager(self.user)
+            self.assertTrue(user_permission.has_permission(self.can_manage_code, module_id=1))
+            self.assertFalse(user_permission.has_permission(self.can_view_code))
+
+        cache.get_cache().delete(cache.lock_key(key))
+        self.assertTrue(PermissionManager(self.user).has_permission(self.can_view_code))
+
+    def test_rebuild_serves_stale_partitions(self):
+        self.can_manage_permission.scope = "module"
+        self.can_manage_permission.save()
+        self.can_view_permission.scope = "module"
+        self.can_view_permission.save()
+        registry.preload_permissions()
+        self.assertTrue(PermissionManager(self.user, partition_by="scope").has_permission(self.can_manage_code, module_id=1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mommy.make("django_ranger.GroupGrant", group=self.group, permission=self.can_view_permission)
+        key = cache.partition_key(self.user.pk, "scope", "module")
+        # another request is rebuilding the partition of the user
+        cache.get_cache().add(cache.lock_key(key), True)
+
+        with self.assertNumQueries(0):
+            user_permission = PermissionManager(self.user, partition_by="scope")
+            self.assertTrue(user_permission.has_permission(self.can_manage_code, module_id=1))
+            self.assertFalse(user_permission.has_permission(self.can_view_code))
+
+        cache.get_cache().delete(cache.lock_key(key))
+        self.assertTrue(PermissionManager(self.user, partition_by="scope").has_permission(self.can_view_code))
+
+    @override_settings(RANGER_GRANT_CACHE_WAIT=0)
+    def test_rebuild_after_write_is_not_stale(self):
+        user_permission = PermissionManager(self.user)
+        self.assertFalse(user_permission.has_permission(self.can_view_code))
+
+        user_permission.grant_permission(self.can_view_code)
+        cache.get_cache().add(cache.lock_key(cache.grants_key(self.user.pk)), True)
+        self.assertTrue(user_permission.has_permission(self.can_view_code))
+
+    def test_rebuild_single_flight(self):
+        loads = []
+        barrier = Barrier(8)
+
+        def load():
+            loads.append(1)
+            sleep(0.1)
+            return ["grants"]
+
+        def rebuild():
+            barrier.wait()
+            results.append(cache.rebuild("ranger:test", load, list, lambda data: data))
+
+        results = []
+        threads = [Thread(target=rebuild) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(results, [["grants"]] * 8)
@@ -0,0 +1,66 @@
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.test import TestCase
+from model_mommy import mommy
+
+from ..cleanup import register_parameter_model, unregister_parameter_model
+from ..models import UserGrant, GroupGrant
+
+
+class CleanupTestCase(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(settings.AUTH_USER_MODEL)
+        self.group = mommy.make("auth.Group")
+        self.user.groups.add(self.group)
+        self.can_manage_permission = mommy.make("django_ranger.Permission",
+                                                code="can_manage:group",
+                                                parameters_definition=["group_id"])
+        register_parameter_model("group_id", Group)
+
+    def tearDown(self):
+        unregister_parameter_model("group_id")
+
+    def test_delete_grants_of_deleted_instance(self):
+        managed_group = mommy.make("auth.Group")
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_manage_permission,
+                   parameter_values={"group_id": managed_group.id})
+        mommy.make("django_ranger.GroupGrant", group=self.group,
+                   permission=self.can_manage_permission,
+                   parameter_values={"group_id": managed_group.id})
+        # stored as given, for a parameter without a declared type
+        mommy.make("django_ranger.UserGrant", user=mommy.make(settings.AUTH_USER_MODEL),
+                   permission=self.can_manage_permission,
+                   parameter_values={"group_id": str(managed_group.id)})
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_manage_permission,
+                   parameter_values={"group_id": self.group.id})
+
+        managed_group_id = managed_group.id
+        managed_group.delete()
+
+        self.assertEqual(UserGrant.objects.filter(parameter_values={"group_id": managed_group_id}).count(), 0)
+        self.assertEqual(UserGrant.objects.filter(parameter_values={"group_id": str(managed_group_id)}).count(), 0)
+        self.assertEqual(GroupGrant.objects.count(), 0)
+        self.assertEqual(UserGrant.objects.filter(parameter_values={"group_id": self.group.id}).count(), 1)
+
+    def test_reconcile_dangling_grants(self):
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_manage_permission,
+                   parameter_values={"group_id": self.group.id + 1000})
+        mommy.make("django_ranger.GroupGrant", group=self.group,
+                   permission=self.can_manage_permission,
+                   parameter_values={"group_id": str(self.group.id + 1000)})
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_manage_permission,
+                   parameter_values={"group_id": str(self.group.id)})
+
+        call_command("ranger_reconcile_grants", batch_size=1, stdout=StringIO())
+
+        self.assertEqual(GroupGrant.objects.count(), 0)
+        self.assertEqual(list(UserGrant.objects.values_list("parameter_values", flat=True)),
+                         [{"group_id": str(self.group.id)}])
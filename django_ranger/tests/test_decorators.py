@@ -1,11 +1,13 @@
 from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
 from django.contrib.auth.models import AnonymousUser
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.test.client import RequestFactory
 from model_mommy import mommy
 from rest_framework.response import Response
 
-from ..decorators import permission_required, api_permission_required
+from ..decorators import cache_page_by_grants, permission_required, api_permission_required
 from ..models import UserGrant
 
 action_list = [('can_view:module', {'country_code': "MX"})]
@@ -21,6 +23,31 @@ def api_view(*args, **kwargs):
     return Response()
 
 
+cached_view_calls = []
+
+
+@cache_page_by_grants(60)
+def cached_view(request):
+    cached_view_calls.append(request.user)
+    return HttpResponse("content")
+
+
+@cache_page_by_grants(60)
+def cookie_view(request):
+    cached_view_calls.append(request.user)
+    response = HttpResponse("content")
+    response.set_cookie('sessionid', str(request.user.pk))
+    return response
+
+
+@cache_page_by_grants(60)
+def private_view(request):
+    cached_view_calls.append(request.user)
+    response = HttpResponse("content")
+    response['Cache-Control'] = 'private'
+    return response
+
+
 class DecoratorTestCase(TestCase):
 
     def setUp(self):
@@ -128,4 +155,51 @@ class DecoratorTestCase(TestCase):
 
         self.assertEqual(response.status_code, 401)
 
+    def test_cache_page_by_grants(self):
+        cache.clear()
+        del cached_view_calls[:]
+        other_user = mommy.make(settings.AUTH_USER_MODEL)
+        UserGrant.objects.create(user=self.user,
+                                 permission=self.can_view_permission,
+                                 parameter_values={'country_code': 'MX'})
+        UserGrant.objects.create(user=other_user,
+                                 permission=self.can_view_permission,
+                                 parameter_values={'country_code': 'MX'})
+        third_user = mommy.make(settings.AUTH_USER_MODEL)
+
+        rf = RequestFactory()
+        for user in [self.user, other_user, third_user]:
+            request = rf.get("/url/")
+            request.user = user
+            response = cached_view(request)
+            self.assertEqual(response.content, b"content")
+
+        self.assertEqual(cached_view_calls, [self.user, third_user])
+
+    @override_settings(ALLOWED_HOSTS=['one.example.com', 'two.example.com'])
+    def test_cache_page_by_grants_host(self):
+        cache.clear()
+        del cached_view_calls[:]
+
+        rf = RequestFactory()
+        for host in ['one.example.com', 'two.example.com', 'one.example.com']:
+            request = rf.get("/url/", HTTP_HOST=host)
+            request.user = self.user
+            response = cached_view(request)
+            self.assertIn('private', response['Cache-Control'])
+
+        self.assertEqual(len(cached_view_calls), 2)
+
+    def test_cache_page_by_grants_not_shared(self):
+        cache.clear()
+        del cached_view_calls[:]
+        other_user = mommy.make(settings.AUTH_USER_MODEL)
+
+        rf = RequestFactory()
+        for view_function in [cookie_view, private_view]:
+            for user in [self.user, other_user]:
+                request = rf.get("/url/")
+                request.user = user
+                view_function(request)
 
+        self.assertEqual(cached_view_calls, [self.user, other_user] * 2)
@@ -1,9 +1,11 @@
 from django.conf import settings
+from django.db import IntegrityError, connection, transaction
 from django.test import TestCase
 from model_mommy import mommy
 
 from ..exceptions import ParameterError
 from ..models import UserGrant
+from ..parameters import hash_parameters
 
 
 class ModelsTestCase(TestCase):
@@ -111,6 +113,74 @@ class ModelsTestCase(TestCase):
 
         self.assertFalse(user_grant.complies(user_grant_2))
 
+    def test_user_grant_complies_with_params_of_different_type(self):
+        can_view_permission = mommy.make("django_ranger.Permission",
+                                         code=self.can_view_code,
+                                         parameters_definition=['model_id'])
+        user_2 = mommy.make(settings.AUTH_USER_MODEL)
+
+        user_grant = UserGrant.objects.create(user=self.user,
+                                              permission=can_view_permission,
+                                              parameter_values={'model_id': 1})
+        user_grant_2 = UserGrant.objects.create(user=user_2,
+                                                permission=can_view_permission,
+                                                parameter_values={'model_id': '1'})
+
+        self.assertEqual(user_grant.parameters_hash, user_grant_2.parameters_hash)
+        self.assertTrue(user_grant.complies(user_grant_2))
+
+    def test_user_grant_complies_with_unsaved_grant(self):
+        can_view_permission = mommy.make("django_ranger.Permission",
+                                         code=self.can_view_code,
+                                         parameters_definition=['model_id'],
+                                         parameter_types={'model_id': 'int'})
+
+        user_grant = UserGrant.objects.create(user=self.user,
+                                              permission=can_view_permission,
+                                              parameter_values={'model_id': 1})
+
+        self.assertTrue(user_grant.complies(UserGrant(permission=can_view_permission, parameter_values={'model_id': '1'})))
+        self.assertFalse(user_grant.complies(UserGrant(permission=can_view_permission, parameter_values={'model_id': 2})))
+        self.assertFalse(user_grant.complies(UserGrant(permission=can_view_permission, parameter_values={'model_id': 'x'})))
+
+    def test_update_parameter_values(self):
+        can_view_permission = mommy.make("django_ranger.Permission",
+                                         code=self.can_view_code,
+                                         parameters_definition=['model_id'],
+                                         parameter_types={'model_id': 'int'})
+        user_grant = UserGrant.objects.create(user=self.user,
+                                              permission=can_view_permission,
+                                              parameter_values={'model_id': 1})
+
+        self.assertEqual(UserGrant.objects.filter(pk=user_grant.pk).update(parameter_values={'model_id': '2'}), 1)
+        user_grant.refresh_from_db()
+        self.assertEqual(user_grant.parameter_values, {'model_id': 2})
+        self.assertTrue(user_grant.complies(UserGrant(permission=can_view_permission, parameter_values={'model_id': 2})))
+        self.assertFalse(user_grant.complies(UserGrant(permission=can_view_permission, parameter_values={'model_id': 1})))
+
+        with self.assertRaises(ParameterError):
+            UserGrant.objects.update(parameter_values={'other_id': 1})
+
+    def test_raw_insert_without_parameters_hash(self):
+        can_view_permission = mommy.make("django_ranger.Permission", code=self.can_view_code)
+        table = UserGrant._meta.db_table
+        with self.assertRaises(IntegrityError), transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("INSERT INTO {} (user_id, permission_id, parameter_values) VALUES (%s, %s, '{{}}')".format(table),
+                           [self.user.pk, can_view_permission.pk])
+
+    def test_create_duplicated_user_grant_with_params_of_different_type(self):
+        can_view_permission = mommy.make("django_ranger.Permission",
+                                         code=self.can_view_code,
+                                         parameters_definition=['model_id'])
+        UserGrant.objects.create(user=self.user,
+                                 permission=can_view_permission,
+                                 parameter_values={'model_id': 1})
+
+        with self.assertRaises(IntegrityError):
+            UserGrant.objects.create(user=self.user,
+                                     permission=can_view_permission,
+                                     parameter_values={'model_id': '1'})
+
     def test_user_grant_not_complies_with_multiple_params(self):
         can_view_permission = mommy.make("django_ranger.Permission",
                                          code=self.can_view_code,
@@ -216,3 +286,63 @@ class ModelsTestCase(TestCase):
         group_grant = mommy.make("django_ranger.GroupGrant", group=self.group, permission=can_view_permission)
         self.assertEqual(group_grant.__str__(), self.can_view_code)
 
+    def test_bit_position_allocation_is_locked(self):
+        first = mommy.make("django_ranger.Permission", code="can_view:first")
+        second = mommy.make("django_ranger.Permission", code="can_view:second")
+        self.assertEqual(second.bit_position, first.bit_position + 1)
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND pid = pg_backend_pid()")
+            # held until the end of the transaction
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_bulk_create_loads_permissions_once(self):
+        can_view_permission = mommy.make("django_ranger.Permission",
+                                         code=self.can_view_code,
+                                         parameters_definition=['model_id'],
+                                         parameter_types={'model_id': 'int'})
+        user_2 = mommy.make(settings.AUTH_USER_MODEL)
+
+        with self.assertNumQueries(2):
+            UserGrant.objects.bulk_create([
+                UserGrant(user=self.user, permission_id=can_view_permission.id, parameter_values={'model_id': '1'}),
+                UserGrant(user=user_2, permission_id=can_view_permission.id),
+            ])
+
+        user_grant = UserGrant.objects.get(user=self.user)
+        self.assertEqual(user_grant.parameter_values, {'model_id': 1})
+        self.assertTrue(UserGrant.objects.get(user=user_2).complies(user_grant))
+
+    def test_bulk_create_inconsistent(self):
+        can_view_permission = mommy.make("django_ranger.Permission",
+                                         code=self.can_view_code,
+                                         parameters_definition=['model_id'])
+
+        with self.assertRaises(ParameterError) as context:
+            UserGrant.objects.bulk_create([
+                UserGrant(user=self.user, permission=can_view_permission, parameter_values={'other_id': 1}),
+                UserGrant(user=self.user, permission=can_view_permission, parameter_values={'model_id': 1}),
+                UserGrant(user=self.user, permission=can_view_permission, parameter_values={'model': 1}),
+            ])
+
+        self.assertIn('grant 0', str(context.exception))
+        self.assertIn('grant 2', str(context.exception))
+        self.assertFalse(UserGrant.objects.exists())
+
+    def test_bulk_create(self):
+        can_view_permission = mommy.make("django_ranger.Permission",
+                                         code=self.can_view_code,
+                                         parameters_definition=['model_id'],
+                                         parameter_types={'model_id': 'int'})
+
+        UserGrant.objects.bulk_create([
+            UserGrant(user=self.user, permission=can_view_permission, parameter_values={'model_id': '1'}),
+        ])
+        user_grant = UserGrant.objects.get(user=self.user)
+        self.assertEqual(user_grant.parameter_values, {'model_id': 1})
+        self.assertEqual(user_grant.parameters_hash, hash_parameters({'model_id': 1}))
+
+        with self.assertRaises(ParameterError):
+            UserGrant.objects.bulk_create([
+                UserGrant(user=self.user, permission=can_view_permission, parameter_values={'other_id': 1}),
+            ])
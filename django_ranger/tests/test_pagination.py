@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.paginator import InvalidPage
+from django.test import TestCase
+from model_mommy import mommy
+
+from ..pagination import KeysetPaginator
+from ..services import PermissionManager, RangerQuerySet
+
+
+class KeysetPaginatorTestCase(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(settings.AUTH_USER_MODEL, is_active=True, username="user-0")
+        for index in range(1, 5):
+            mommy.make(settings.AUTH_USER_MODEL, is_active=index % 2 == 0, username="user-%s" % index)
+        self.can_view_code = "can_view_users"
+        self.can_view_permission = mommy.make("django_ranger.Permission",
+                                              code=self.can_view_code,
+                                              parameters_definition=["active"])
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_view_permission,
+                   parameter_values={"active": True})
+
+    def test_paginate_ranger_queryset(self):
+        action_list = [(self.can_view_code, {"active": "is_active"})]
+        queryset = RangerQuerySet(self.user._meta.model, PermissionManager(self.user), action_list)
+        paginator = KeysetPaginator(queryset, ordering=("-username",), per_page=2)
+
+        page = paginator.page()
+        self.assertEqual([user.username for user in page], ["user-4", "user-2"])
+        self.assertTrue(page.has_next())
+
+        page = paginator.page(page.next_cursor)
+        self.assertEqual([user.username for user in page], ["user-0"])
+        self.assertFalse(page.has_next())
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(self.user._meta.model.objects.all(), ordering=("username",), per_page=2)
+        cursor = paginator.page().next_cursor
+
+        with self.assertRaises(InvalidPage):
+            paginator.page("invalid")
+
+        with self.assertRaises(InvalidPage):
+            KeysetPaginator(self.user._meta.model.objects.all(), ordering=("-username",)).page(cursor)
@@ -0,0 +1,47 @@
+from uuid import UUID
+
+from django.test import SimpleTestCase
+
+from ..exceptions import ParameterError
+from ..parameters import hash_parameters, normalize_parameters
+
+
+class ParametersTestCase(SimpleTestCase):
+
+    def test_normalize_parameters(self):
+        parameter_types = {
+            "store_id": "int",
+            "country_code": "str",
+            "token": "uuid",
+            "status": ["open", "closed"],
+        }
+        parameter_values = {
+            "store_id": "42",
+            "country_code": "MX",
+            "token": UUID("12345678-1234-5678-1234-567812345678"),
+            "status": "open",
+            "other": 1,
+        }
+
+        response = normalize_parameters(parameter_types, parameter_values)
+        self.assertEqual(response, {
+            "store_id": 42,
+            "country_code": "MX",
+            "token": "12345678-1234-5678-1234-567812345678",
+            "status": "open",
+            "other": 1,
+        })
+
+    def test_normalize_invalid_parameters(self):
+        with self.assertRaises(ParameterError):
+            normalize_parameters({"store_id": "int"}, {"store_id": "abc"})
+
+        with self.assertRaises(ParameterError):
+            normalize_parameters({"status": ["open", "closed"]}, {"status": "pending"})
+
+        with self.assertRaises(ParameterError):
+            normalize_parameters({"token": "uuid"}, {"token": "abc"})
+
+    def test_hash_parameters(self):
+        self.assertEqual(hash_parameters({"a": 1, "b": "2"}), hash_parameters({"b": 2, "a": "1"}))
+        self.assertNotEqual(hash_parameters({"a": 1}), hash_parameters({"a": 2}))
@@ -0,0 +1,98 @@
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from model_mommy import mommy
+
+from .. import cache, policies, registry
+from ..services import PermissionManager
+
+
+@override_settings(RANGER_GRANT_CACHE='default', RANGER_INTERN_GROUP_POLICIES=True)
+class GroupPoliciesTestCase(TestCase):
+
+    def setUp(self):
+        cache.connect_signals()
+        cache.get_cache().clear()
+        policies.clear_policies()
+        self.group = mommy.make("auth.Group")
+        self.user = mommy.make(settings.AUTH_USER_MODEL)
+        self.other_user = mommy.make(settings.AUTH_USER_MODEL)
+        self.user.groups.add(self.group)
+        self.other_user.groups.add(self.group)
+        self.can_view_code = "can_view:module"
+        self.can_manage_code = "can_manage:module"
+        self.can_view_permission = mommy.make("django_ranger.Permission", code=self.can_view_code)
+        self.can_manage_permission = mommy.make("django_ranger.Permission",
+                                                code=self.can_manage_code,
+                                                parameters_definition=["module_id"])
+        mommy.make("django_ranger.GroupGrant", group=self.group,
+                   permission=self.can_manage_permission,
+                   parameter_values={"module_id": 1})
+
+    def tearDown(self):
+        cache.disconnect_signals()
+        policies.clear_policies()
+
+    def test_shared_policies(self):
+        user_permission = PermissionManager(self.user)
+        self.assertTrue(user_permission.has_permission(self.can_manage_code, module_id=1))
+        registry.preload_permissions()
+
+        # the user grants and groups are loaded, the group policy is interned
+        with self.assertNumQueries(2):
+            other_permission = PermissionManager(self.other_user)
+            self.assertTrue(other_permission.has_permission(self.can_manage_code, module_id=1))
+            self.assertFalse(other_permission.has_permission(self.can_manage_code, module_id=2))
+
+        self.assertIs(user_permission._group_policies[0], other_permission._group_policies[0])
+
+        with self.assertNumQueries(0):
+            self.assertTrue(PermissionManager(self.other_user).has_permission(self.can_manage_code, module_id=1))
+
+    def test_own_grants(self):
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_manage_permission,
+                   parameter_values={"module_id": 2})
+
+        user_permission = PermissionManager(self.user)
+        self.assertTrue(user_permission.has_permission(self.can_manage_code, module_id=1))
+        self.assertTrue(user_permission.has_permission(self.can_manage_code, module_id=2))
+        self.assertFalse(PermissionManager(self.other_user).has_permission(self.can_manage_code, module_id=2))
+        self.assertEqual(len(user_permission.get_grants()), 2)
+
+    def test_policy_invalidation(self):
+        self.assertFalse(PermissionManager(self.user).has_permission(self.can_view_code))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mommy.make("django_ranger.GroupGrant", group=self.group, permission=self.can_view_permission)
+        self.assertTrue(PermissionManager(self.user).has_permission(self.can_view_code))
+        self.assertTrue(PermissionManager(self.other_user).has_permission(self.can_view_code))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.remove(self.group)
+        self.assertFalse(PermissionManager(self.user).has_permission(self.can_view_code))
+
+    def test_version_renewed_on_commit(self):
+        self.assertFalse(PermissionManager(self.user).has_permission(self.can_view_code))
+        version = cache.get_group_versions([self.group.pk])[self.group.pk]
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            mommy.make("django_ranger.GroupGrant", group=self.group, permission=self.can_view_permission)
+            self.assertEqual(cache.get_group_versions([self.group.pk])[self.group.pk], version)
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.get_group_versions([self.group.pk])[self.group.pk], version)
+        self.assertTrue(PermissionManager(self.user).has_permission(self.can_view_code))
+
+    def test_warm_entries(self):
+        call_command("ranger_warm_grants", stdout=StringIO())
+        registry.preload_permissions()
+        self.assertEqual(cache.get_user_entry(self.user)[1], [self.group.pk])
+
+        PermissionManager(self.user).has_permission(self.can_manage_code, module_id=1)
+        # the user grants and groups are cached, only the group policy is loaded
+        with self.assertNumQueries(0):
+            self.assertTrue(PermissionManager(self.other_user).has_permission(self.can_manage_code, module_id=1))
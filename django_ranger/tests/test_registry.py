@@ -0,0 +1,106 @@
+from io import StringIO
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from model_mommy import mommy
+
+from .. import registry
+from ..decorators import prepare_action_list
+from ..exceptions import ParameterError
+from ..models import Permission
+from ..parameters import hash_parameters
+
+
+class RegistryTestCase(TestCase):
+
+    def setUp(self):
+        self.can_view_code = "can_view:module"
+        self.can_manage_code = "can_manage:module"
+        registry.register(self.can_view_code, scope="module")
+        registry.register(self.can_manage_code, scope="module", parameters={"module_id": "int"})
+
+    def tearDown(self):
+        registry.unregister(self.can_view_code)
+        registry.unregister(self.can_manage_code)
+        registry.clear_permissions()
+
+    def test_sync_permissions(self):
+        mommy.make("django_ranger.Permission", code=self.can_view_code, scope="old")
+
+        call_command("ranger_sync_permissions", stdout=StringIO())
+
+        self.assertEqual(Permission.objects.get(code=self.can_view_code).scope, "module")
+        can_manage_permission = Permission.objects.get(code=self.can_manage_code)
+        self.assertEqual(can_manage_permission.parameters_definition, ["module_id"])
+        self.assertEqual(can_manage_permission.parameter_types, {"module_id": "int"})
+
+    def test_sync_permissions_normalizes_grants(self):
+        user = mommy.make(settings.AUTH_USER_MODEL)
+        permission = mommy.make("django_ranger.Permission", code=self.can_manage_code, scope="module",
+                                parameters_definition=["module_id"])
+        grant = mommy.make("django_ranger.UserGrant", user=user, permission=permission,
+                           parameter_values={"module_id": "1"})
+
+        registry.sync_permissions()
+
+        grant.refresh_from_db()
+        self.assertEqual(grant.parameter_values, {"module_id": 1})
+        self.assertEqual(grant.parameters_hash, hash_parameters({"module_id": 1}))
+
+    def test_sync_permissions_refuses_inconsistent_grants(self):
+        user = mommy.make(settings.AUTH_USER_MODEL)
+        permission = mommy.make("django_ranger.Permission", code=self.can_manage_code, scope="module",
+                                parameters_definition=["module_id"])
+        mommy.make("django_ranger.UserGrant", user=user, permission=permission, parameter_values={"module_id": "abc"})
+
+        with self.assertRaises(ParameterError):
+            registry.sync_permissions()
+        self.assertEqual(Permission.objects.get(code=self.can_manage_code).parameter_types, {})
+
+    def test_get_permission_from_memory(self):
+        registry.sync_permissions()
+        registry.get_permission(self.can_view_code)
+
+        with self.assertNumQueries(0):
+            permission = registry.get_permission(self.can_manage_code)
+        self.assertEqual(permission.code, self.can_manage_code)
+
+    @override_settings(RANGER_PERMISSION_TIMEOUT=0)
+    def test_get_permission_reloaded_after_timeout(self):
+        registry.sync_permissions()
+        registry.get_permission(self.can_view_code)
+
+        # changed by another process
+        Permission.objects.filter(code=self.can_view_code).update(scope="other")
+        self.assertEqual(registry.get_permission(self.can_view_code).scope, "other")
+
+    @override_settings(RANGER_PERMISSION_TIMEOUT=0, RANGER_GRANT_CACHE="default")
+    def test_get_permission_shared_version(self):
+        registry.sync_permissions()
+        registry.preload_permissions()
+
+        with self.assertNumQueries(0):
+            registry.get_permission(self.can_view_code)
+
+        # changed by another process, which renews the shared version on commit
+        Permission.objects.filter(code=self.can_view_code).update(scope="other")
+        registry._renew_shared_version()
+        self.assertEqual(registry.get_permission(self.can_view_code).scope, "other")
+
+    def test_get_permission_does_not_exist(self):
+        with self.assertRaises(Permission.DoesNotExist):
+            registry.get_permission("can_delete:module")
+
+    def test_prepare_action_list(self):
+        action_list = prepare_action_list([self.can_view_code, (self.can_manage_code, {"module_id": "1"})])
+        self.assertEqual(action_list, [(self.can_view_code, {}), (self.can_manage_code, {"module_id": 1})])
+
+    def test_prepare_action_list_not_declared(self):
+        with self.assertRaises(ImproperlyConfigured):
+            prepare_action_list(["can_delete:module"])
+
+    def test_prepare_action_list_inconsistent_params(self):
+        with self.assertRaises(ImproperlyConfigured):
+            prepare_action_list([(self.can_manage_code, {"other_id": 1})])
@@ -0,0 +1,106 @@
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from model_mommy import mommy
+
+from .. import rls
+
+
+class RowLevelSecurityTestCase(TestCase):
+
+    def setUp(self):
+        self.user_model = get_user_model()
+        self.user = mommy.make(settings.AUTH_USER_MODEL, is_active=True)
+        self.inactive_user = mommy.make(settings.AUTH_USER_MODEL, is_active=False)
+        self.other_user = mommy.make(settings.AUTH_USER_MODEL, is_active=False)
+        self.group = mommy.make("auth.Group")
+        self.user.groups.add(self.group)
+        self.can_view_code = "can_view_users"
+        self.can_view_user_code = "can_view_user"
+        self.can_view_permission = mommy.make("django_ranger.Permission", code=self.can_view_code,
+                                              parameters_definition=["active"])
+        self.can_view_user_permission = mommy.make("django_ranger.Permission", code=self.can_view_user_code,
+                                                   parameters_definition=["user_id"],
+                                                   parameter_types={"user_id": "int"})
+        rls.register_model(self.user_model, [(self.can_view_code, {'active': 'is_active'}),
+                                             (self.can_view_user_code, {'user_id': 'id'})])
+
+    def tearDown(self):
+        rls.unregister_model(self.user_model)
+
+    def apply_policies(self):
+        roles = ("ranger_rls_reader", "ranger_rls_other")
+        # roles are created in the test transaction, so they are rolled back with it
+        with connection.cursor() as cursor:
+            for role in roles:
+                cursor.execute("CREATE ROLE %s" % role)
+            # the table can not be altered with pending deferred constraints
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        call_command("ranger_rls_policies", role="ranger_rls_reader", apply=True, stdout=StringIO())
+
+        with connection.cursor() as cursor:
+            for role in roles:
+                cursor.execute("GRANT SELECT, UPDATE ON %s, %s TO %s" % (
+                    connection.ops.quote_name(self.user_model._meta.db_table), rls.VIEW_NAME, role))
+
+    def visible_user_ids(self, user, role="ranger_rls_reader"):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL ROLE %s" % role)
+            cursor.execute("SELECT set_config('ranger.user_id', %s, true)", [str(user.pk)])
+            cursor.execute("SELECT id FROM %s" % connection.ops.quote_name(self.user_model._meta.db_table))
+            user_ids = {row[0] for row in cursor.fetchall()}
+            cursor.execute("RESET ROLE")
+        return user_ids
+
+    def test_print_policies(self):
+        stdout = StringIO()
+        call_command("ranger_rls_policies", role="reporting", stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn("CREATE OR REPLACE VIEW", output)
+        self.assertIn("FOR SELECT TO \"reporting\"", output)
+        self.assertIn("current_setting('ranger.user_id', true)", output)
+
+    def test_role_is_required(self):
+        with self.assertRaises(CommandError):
+            call_command("ranger_rls_policies", stdout=StringIO())
+
+    def test_other_roles(self):
+        self.apply_policies()
+        all_user_ids = {self.user.pk, self.inactive_user.pk, self.other_user.pk}
+        self.assertEqual(self.visible_user_ids(self.user, role="ranger_rls_other"), all_user_ids)
+
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL ROLE ranger_rls_other")
+            cursor.execute("UPDATE %s SET first_name = 'updated'" % connection.ops.quote_name(
+                self.user_model._meta.db_table))
+            self.assertEqual(cursor.rowcount, len(all_user_ids))
+            cursor.execute("RESET ROLE")
+
+    def test_apply_policies(self):
+        self.apply_policies()
+        self.assertEqual(self.visible_user_ids(self.user), set())
+
+        mommy.make("django_ranger.GroupGrant", group=self.group, permission=self.can_view_permission,
+                   parameter_values={"active": False})
+        mommy.make("django_ranger.UserGrant", user=self.user, permission=self.can_view_user_permission,
+                   parameter_values={"user_id": self.user.pk})
+        self.assertEqual(self.visible_user_ids(self.user), {self.user.pk, self.inactive_user.pk, self.other_user.pk})
+        self.assertEqual(self.visible_user_ids(self.other_user), set())
+
+        mommy.make("django_ranger.UserGrant", user=self.other_user, permission=self.can_view_user_permission)
+        self.assertEqual(self.visible_user_ids(self.other_user), {self.user.pk, self.inactive_user.pk, self.other_user.pk})
+
+    def test_invalid_lookup(self):
+        rls.register_model(self.user_model, [(self.can_view_code, {'active': 'groups__name'})])
+        with self.assertRaises(CommandError):
+            call_command("ranger_rls_policies", role="reporting", stdout=StringIO())
+
+    def test_unregistered_model(self):
+        with self.assertRaises(CommandError):
+            call_command("ranger_rls_policies", "auth.Group", role="reporting", stdout=StringIO())
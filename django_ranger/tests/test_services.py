@@ -1,9 +1,13 @@
 from django.conf import settings
-from django.test import TestCase
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from django.test.client import RequestFactory
 from model_mommy import mommy
 
-from ..models import UserGrant
-from ..services import PermissionManager, RangerQuerySet
+from .. import registry
+from ..exceptions import ParameterError
+from ..models import Permission, UserGrant
+from ..services import PermissionManager, RangerQuerySet, get_permission_manager
 
 
 class HasPermissionTestCase(TestCase):
@@ -29,6 +33,31 @@ class HasPermissionTestCase(TestCase):
         user_grant = UserGrant.objects.filter(permission__code=self.can_view_with_param_code, user=self.user, parameter_values=params)
         self.assertTrue(user_grant.exists())
 
+    def test_permission_manager_grant_permission_twice(self):
+        params = {
+            "model_id": 1
+        }
+
+        user_permission = PermissionManager(self.user)
+        user_permission.grant_permission(self.can_view_with_param_code, **params)
+        user_permission.grant_permission(self.can_view_with_param_code, **params)
+        user_grant = UserGrant.objects.filter(permission__code=self.can_view_with_param_code, user=self.user, parameter_values=params)
+        self.assertEqual(user_grant.count(), 1)
+
+    def test_permission_manager_grant_permission_inconsistent_params(self):
+        user_permission = PermissionManager(self.user)
+        with self.assertRaises(ParameterError):
+            user_permission.grant_permission(self.can_view_with_param_code, other_id=1)
+
+    def test_permission_manager_grant_permission_read_your_writes(self):
+        user_permission = PermissionManager(self.user, using="default", read_your_writes=True)
+        self.assertFalse(user_permission.has_permission(self.can_view_code))
+
+        user_permission.grant_permission(self.can_view_code)
+        self.assertTrue(user_permission.pinned_to_write_db)
+        self.assertEqual(user_permission.read_db, user_permission.write_db)
+        self.assertTrue(user_permission.has_permission(self.can_view_code))
+
     def test_permission_manager_not_grant_permission_when_have_one_without_params(self):
         params = {
             "model_id": 1
@@ -123,6 +152,46 @@ class HasPermissionTestCase(TestCase):
         response = user_permission.has_permission(self.can_view_with_param_code)
         self.assertFalse(response)
 
+    def test_permission_manager_has_permission_with_typed_params(self):
+        self.can_view_permission_with_param.parameter_types = {"model_id": "int"}
+        self.can_view_permission_with_param.save()
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={"model_id": "42"})
+
+        user_permission = PermissionManager(self.user)
+        self.assertTrue(user_permission.has_permission(self.can_view_with_param_code, model_id=42))
+        self.assertTrue(user_permission.has_permission(self.can_view_with_param_code, model_id="42"))
+        self.assertFalse(user_permission.has_permission(self.can_view_with_param_code, model_id="abc"))
+        self.assertEqual(UserGrant.objects.get(user=self.user).parameter_values, {"model_id": 42})
+
+    def test_permission_manager_memoized_has_permission(self):
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={"model_id": 1})
+
+        user_permission = PermissionManager(self.user, memo_size=1)
+        self.assertTrue(user_permission.has_permission(self.can_view_with_param_code, model_id=1))
+        with self.assertNumQueries(0):
+            self.assertTrue(user_permission.has_permission(self.can_view_with_param_code, model_id=1))
+        self.assertFalse(user_permission.has_permission(self.can_view_with_param_code, model_id=2))
+        self.assertEqual(len(user_permission._memo), 1)
+
+        user_permission.grant_permission(self.can_view_with_param_code, model_id=2)
+        self.assertTrue(user_permission.has_permission(self.can_view_with_param_code, model_id=2))
+
+    def test_permission_manager_memo_key_is_typed(self):
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={"model_id": 1})
+
+        user_permission = PermissionManager(self.user)
+        self.assertFalse(user_permission.has_permission(self.can_view_with_param_code, model_id=True))
+        # True == 1, but they are different parameter values
+        self.assertTrue(user_permission.has_permission(self.can_view_with_param_code, model_id=1))
+        self.assertTrue(user_permission.has_permission(self.can_view_with_param_code, model_id="1"))
+        self.assertEqual(len(user_permission._memo), 3)
+
     def test_permission_manager_has_any_permission(self):
         params = {
             "model_id": 1
@@ -137,6 +206,49 @@ class HasPermissionTestCase(TestCase):
         response = user_permission.has_any_permission(action_list)
         self.assertTrue(response)
 
+    def test_has_any_permission_stops_at_granted_action(self):
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={"model_id": 1})
+
+        action_list = [(self.can_view_with_param_code, {'model_id': 1}), ("can_view:unknown", {})]
+        self.assertTrue(PermissionManager(self.user).has_any_permission(action_list))
+
+        with self.assertRaises(Permission.DoesNotExist):
+            PermissionManager(self.user).has_any_permission(list(reversed(action_list)))
+
+    def test_permission_manager_role_mask(self):
+        mommy.make("django_ranger.UserGrant", user=self.user, permission=self.can_view_permission)
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={"model_id": 1})
+
+        user_permission = PermissionManager(self.user)
+        self.assertEqual(user_permission.role_mask, 1 << self.can_view_permission.bit_position)
+        self.assertNotEqual(self.can_view_permission.bit_position, self.can_view_permission_with_param.bit_position)
+
+    def test_permission_manager_fingerprint(self):
+        other_user = mommy.make(settings.AUTH_USER_MODEL)
+        mommy.make("django_ranger.GroupGrant", group=self.group,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={"model_id": 1})
+        mommy.make("django_ranger.UserGrant", user=other_user,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={"model_id": "1"})
+        mommy.make("django_ranger.UserGrant", user=other_user, permission=self.can_view_permission)
+
+        user_permission = PermissionManager(self.user)
+        other_user_permission = PermissionManager(other_user)
+        self.assertNotEqual(user_permission.fingerprint(), other_user_permission.fingerprint())
+        self.assertEqual(user_permission.fingerprint([self.can_view_with_param_code]),
+                         other_user_permission.fingerprint([self.can_view_with_param_code]))
+
+    def test_get_permission_manager(self):
+        request = RequestFactory().get("/url/")
+        request.user = self.user
+
+        self.assertIs(get_permission_manager(request), get_permission_manager(request))
+
     def test_permission_manager_has_not_any_permission(self):
         params = {
             "model_id": 1
@@ -151,6 +263,141 @@ class HasPermissionTestCase(TestCase):
         response = user_permission.has_any_permission(action_list)
         self.assertFalse(response)
 
+    def test_permission_manager_allowed_values(self):
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={"model_id": 1})
+        mommy.make("django_ranger.GroupGrant", group=self.group,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={"model_id": 3})
+
+        user_permission = PermissionManager(self.user)
+        response = user_permission.allowed_values(self.can_view_with_param_code, "model_id", [1, 2, 3])
+        self.assertEqual(response, [1, 3])
+
+    def test_permission_manager_allowed_values_without_params(self):
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={})
+
+        user_permission = PermissionManager(self.user)
+        response = user_permission.allowed_values(self.can_view_with_param_code, "model_id", [1, 2, 3])
+        self.assertEqual(response, [1, 2, 3])
+
+    def test_permission_manager_allowed_values_without_grants(self):
+        user_permission = PermissionManager(self.user)
+        response = user_permission.allowed_values(self.can_view_with_param_code, "model_id", [1, 2, 3])
+        self.assertEqual(response, [])
+
+    def test_permission_manager_explain(self):
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={"model_id": 1})
+        mommy.make("django_ranger.GroupGrant", group=self.group,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={"model_id": 2})
+        mommy.make("django_ranger.GroupGrant", group=self.group, permission=self.can_view_permission)
+        self.can_view_permission_with_param.parameter_types = {"model_id": "int"}
+        self.can_view_permission_with_param.save()
+        registry.preload_permissions()
+
+        user_permission = PermissionManager(self.user)
+        explanation = user_permission.explain(self.can_view_with_param_code, model_id=2)
+        self.assertTrue(explanation["granted"])
+        self.assertEqual([grant.parameter_values for grant in explanation["grants"]], [{"model_id": 2}])
+        self.assertEqual(explanation["sources"], ["group"])
+        self.assertEqual(explanation["strategy"], "hash_index")
+        self.assertEqual(explanation["grants_scanned"], 2)
+        self.assertEqual(explanation["queries"], 1)
+        self.assertGreaterEqual(explanation["elapsed"], 0)
+
+        explanation = user_permission.explain(self.can_view_with_param_code, model_id=3)
+        self.assertFalse(explanation["granted"])
+        self.assertEqual(explanation["queries"], 0)
+
+        explanation = user_permission.explain(self.can_view_code)
+        self.assertEqual((explanation["granted"], explanation["strategy"]), (True, "role_mask"))
+
+        explanation = user_permission.explain(self.can_view_with_param_code, model_id="x")
+        self.assertEqual((explanation["granted"], explanation["strategy"]), (False, "invalid_parameters"))
+
+    def test_permission_manager_loads_grants_in_one_query(self):
+        for model_id in [1, 2]:
+            mommy.make("django_ranger.UserGrant", user=self.user,
+                       permission=self.can_view_permission_with_param,
+                       parameter_values={"model_id": model_id})
+        for model_id in [2, 3]:
+            mommy.make("django_ranger.GroupGrant", group=self.group,
+                       permission=self.can_view_permission_with_param,
+                       parameter_values={"model_id": model_id})
+        mommy.make("django_ranger.GroupGrant", permission=self.can_view_permission)
+        registry.preload_permissions()
+
+        user_permission = PermissionManager(self.user)
+        with self.assertNumQueries(1):
+            grants = user_permission.get_grants()
+
+        sources = sorted((grant.parameter_values["model_id"], grant.source) for grant in grants)
+        self.assertEqual(sources, [(1, "user"), (2, "user"), (3, "group")])
+        self.assertFalse(user_permission.has_permission(self.can_view_code))
+
+
+class PermissionManagerPartitionTestCase(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(settings.AUTH_USER_MODEL)
+        self.group = mommy.make("auth.Group")
+        self.user.groups.add(self.group)
+        self.can_view_code = "can_view:module"
+        self.can_manage_code = "can_manage:module"
+        self.can_view_store_code = "can_view:store"
+        self.can_view_permission = mommy.make("django_ranger.Permission", code=self.can_view_code, scope="module")
+        self.can_manage_permission = mommy.make("django_ranger.Permission", code=self.can_manage_code, scope="module",
+                                                parameters_definition=["module_id"])
+        self.can_view_store_permission = mommy.make("django_ranger.Permission", code=self.can_view_store_code,
+                                                    scope="store")
+        mommy.make("django_ranger.UserGrant", user=self.user, permission=self.can_view_permission)
+        mommy.make("django_ranger.GroupGrant", group=self.group, permission=self.can_manage_permission,
+                   parameter_values={"module_id": 1})
+        mommy.make("django_ranger.GroupGrant", group=self.group, permission=self.can_view_store_permission)
+        registry.preload_permissions()
+
+    def test_load_grants_by_scope(self):
+        user_permission = PermissionManager(self.user, partition_by="scope")
+        with self.assertNumQueries(1):
+            self.assertTrue(user_permission.has_permission(self.can_view_code))
+            self.assertTrue(user_permission.has_permission(self.can_manage_code, module_id=1))
+            self.assertFalse(user_permission.has_permission(self.can_manage_code, module_id=2))
+        self.assertEqual(list(user_permission._partitions), ["module"])
+
+        with self.assertNumQueries(1):
+            self.assertTrue(user_permission.has_any_permission([(self.can_view_store_code, {})]))
+        self.assertEqual(len(user_permission.get_grants()), 3)
+
+    def test_load_grants_by_code(self):
+        user_permission = PermissionManager(self.user, partition_by="code")
+        with self.assertNumQueries(2):
+            self.assertTrue(user_permission.has_permission(self.can_view_code))
+            self.assertEqual(user_permission.allowed_values(self.can_manage_code, "module_id", [1, 2]), [1])
+        self.assertEqual(len(user_permission.get_grants([self.can_view_code])), 1)
+
+    def test_fingerprint_by_scope(self):
+        user_permission = PermissionManager(self.user, partition_by="scope")
+        self.assertEqual(user_permission.fingerprint([self.can_view_code]),
+                         PermissionManager(self.user).fingerprint([self.can_view_code]))
+        self.assertEqual(user_permission.fingerprint(), PermissionManager(self.user).fingerprint())
+
+    def test_written_forgets_partitions(self):
+        user_permission = PermissionManager(self.user, partition_by="scope")
+        self.assertTrue(user_permission.has_permission(self.can_view_code))
+
+        user_permission.revoke_permission(self.can_view_code)
+        self.assertFalse(user_permission.has_permission(self.can_view_code))
+
+    def test_invalid_partition(self):
+        with self.assertRaises(ImproperlyConfigured):
+            PermissionManager(self.user, partition_by="group")
+
 
 class RangerQuerySetTestCase(TestCase):
 
@@ -336,3 +583,181 @@ class RangerQuerySetTestCase(TestCase):
         queryset = RangerQuerySet(user_model, user_permission, action_list)
         queryset = queryset.filter()
         self.assertEqual(queryset.count(), 0)
+
+    def test_annotate_permissions(self):
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={'active': True})
+        mommy.make("django_ranger.UserGrant", user=self.user, permission=self.can_view_permission)
+
+        action_list = [(self.can_view_with_param_code, {'active': 'is_active'}), (self.can_view_code, {})]
+        user_permission = PermissionManager(self.user)
+        user_model = self.user._meta.model
+
+        queryset = RangerQuerySet(user_model.objects.all(), user_permission, action_list)
+        queryset = queryset.annotate_permissions({
+            'can_view': self.can_view_with_param_code,
+            'can_view_all': self.can_view_code,
+        })
+        rows = {row['is_active']: (row['can_view'], row['can_view_all']) for row in
+                queryset.values('is_active', 'can_view', 'can_view_all')}
+        self.assertEqual(rows, {True: (True, True), False: (False, True)})
+
+    def test_annotate_permissions_without_params(self):
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={})
+
+        action_list = [(self.can_view_with_param_code, {'active': 'is_active'})]
+        user_permission = PermissionManager(self.user)
+        user_model = self.user._meta.model
+
+        queryset = RangerQuerySet(user_model, user_permission, action_list)
+        queryset = queryset.filter().annotate_permissions({'can_view': self.can_view_with_param_code})
+        self.assertEqual([row.can_view for row in queryset], [True, True])
+
+    def test_filter_by_permissions_once_through_clones(self):
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={'active': True})
+
+        action_list = [(self.can_view_with_param_code, {'active': 'is_active'}), (self.can_view_code, {})]
+        user_permission = PermissionManager(self.user)
+        user_model = self.user._meta.model
+
+        queryset = RangerQuerySet(user_model, user_permission, action_list)
+        self.assertEqual(queryset.count(), 1)
+        self.assertTrue(queryset.filter(is_active=True).exists())
+        self.assertFalse(queryset.exclude(is_active=True).exists())
+        self.assertEqual(list(queryset.order_by('pk').values_list('pk', flat=True)), [self.user.pk])
+        self.assertEqual([user.pk for user in queryset.iterator(chunk_size=1)], [self.user.pk])
+        self.assertEqual(str(queryset.all().all().values('pk').query).count('is_active'), 1)
+
+    def test_filter_by_permissions_after_failure(self):
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={'active': True})
+        mommy.make(settings.AUTH_USER_MODEL, is_active=False)
+
+        class FailingPermissionManager(PermissionManager):
+            failures = 1
+
+            def get_grants(self, codes=None):
+                if self.failures:
+                    self.failures -= 1
+                    raise RuntimeError("grants can not be loaded")
+                return super(FailingPermissionManager, self).get_grants(codes)
+
+        action_list = [(self.can_view_with_param_code, {'active': 'is_active'})]
+        queryset = RangerQuerySet(self.user._meta.model, FailingPermissionManager(self.user), action_list)
+        with self.assertRaises(RuntimeError):
+            queryset.count()
+        self.assertEqual(list(queryset.values_list('is_active', flat=True)), [True])
+
+    def test_filter_skips_grants_stored_before_their_types(self):
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={'active': 'abc'})
+        Permission.objects.filter(pk=self.can_view_permission_with_param.pk).update(parameter_types={'active': 'int'})
+        registry.clear_permissions()
+
+        action_list = [(self.can_view_with_param_code, {'active': 'is_active'})]
+        queryset = RangerQuerySet(self.user._meta.model, PermissionManager(self.user), action_list)
+        self.assertEqual(queryset.count(), 0)
+
+        mommy.make("django_ranger.UserGrant", user=self.user, permission=self.can_view_permission)
+        action_list = [(self.can_view_code, {})]
+        queryset = RangerQuerySet(self.user._meta.model, PermissionManager(self.user), action_list)
+        queryset = queryset.annotate_permissions({'can_view': self.can_view_with_param_code})
+        self.assertEqual({row.can_view for row in queryset}, {False})
+
+    def test_filter_without_permissions_is_empty(self):
+        action_list = [(self.can_view_with_param_code, {'active': 'is_active'})]
+        user_permission = PermissionManager(self.user)
+        user_model = self.user._meta.model
+
+        user_permission.get_grants()
+        queryset = RangerQuerySet(user_model, user_permission, action_list)
+        with self.assertNumQueries(0):
+            self.assertEqual(queryset.count(), 0)
+        self.assertEqual(list(queryset.iterator()), [])
+
+    @override_settings(RANGER_PREDICATE_THRESHOLDS={'or': 1, 'in': 2, 'any': 3})
+    def test_predicate_strategies(self):
+        can_view_user_code = "can_view_user"
+        can_view_user_permission = mommy.make("django_ranger.Permission", code=can_view_user_code,
+                                              parameters_definition=["user_id"],
+                                              parameter_types={"user_id": "int"})
+        users = [self.user] + mommy.make(settings.AUTH_USER_MODEL, _quantity=4)
+        action_list = [(can_view_user_code, {'user_id': 'id'})]
+        user_model = self.user._meta.model
+
+        for count, strategy in [(1, 'or'), (2, 'in'), (3, 'any'), (4, 'values')]:
+            mommy.make("django_ranger.UserGrant", user=self.user, permission=can_view_user_permission,
+                       parameter_values={"user_id": users[count - 1].pk})
+
+            queryset = RangerQuerySet(user_model, PermissionManager(self.user), action_list)
+            self.assertEqual(queryset.predicate_strategies, {'id': strategy})
+            self.assertEqual(set(queryset.values_list('pk', flat=True)), {user.pk for user in users[:count]})
+            if strategy in ('any', 'values'):
+                # the values are cast to the type of the column, not of its declaration, e.g. serial
+                self.assertIn('::integer', str(queryset.query))
+
+            queryset = queryset.annotate_permissions({'can_view_user': can_view_user_code})
+            self.assertEqual([row.can_view_user for row in queryset], [True] * count)
+
+    def test_predicate_strategies_of_several_parameters(self):
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={'active': True})
+
+        action_list = [(self.can_view_with_param_code, {'active': 'is_active'})]
+        queryset = RangerQuerySet(self.user._meta.model, PermissionManager(self.user), action_list)
+        self.assertEqual(queryset.filter(pk__gt=0).predicate_strategies, {'is_active': 'or'})
+
+        PermissionManager(self.user).grant_permission(self.can_view_with_param_code)
+        queryset = RangerQuerySet(self.user._meta.model, PermissionManager(self.user), action_list)
+        self.assertEqual(queryset.predicate_strategies, {})
+
+    def test_explain_permissions(self):
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_view_permission_with_param,
+                   parameter_values={'active': True})
+
+        registry.preload_permissions()
+
+        action_list = [(self.can_view_with_param_code, {'active': 'is_active'}), (self.can_view_code, {})]
+        queryset = RangerQuerySet(self.user._meta.model, PermissionManager(self.user), action_list)
+        explanation = queryset.explain_permissions()
+        self.assertEqual([grant.parameter_values for grant in explanation["grants"]], [{'active': True}])
+        self.assertEqual(explanation["sources"], ["user"])
+        self.assertEqual(explanation["strategies"], {'is_active': 'or'})
+        self.assertEqual((explanation["unrestricted"], explanation["empty"]), (False, False))
+        self.assertEqual(explanation["grants_scanned"], 1)
+        self.assertEqual(explanation["queries"], 1)
+        self.assertIn('"is_active"', explanation["sql"])
+
+        mommy.make("django_ranger.GroupGrant", group=self.group, permission=self.can_view_permission)
+        queryset = RangerQuerySet(self.user._meta.model, PermissionManager(self.user), action_list)
+        explanation = queryset.explain_permissions()
+        self.assertEqual(explanation["sources"], ["group", "user"])
+        self.assertEqual((explanation["unrestricted"], explanation["strategies"]), (True, {}))
+
+        queryset = RangerQuerySet(self.user._meta.model, PermissionManager(mommy.make(settings.AUTH_USER_MODEL)), action_list)
+        explanation = queryset.explain_permissions()
+        self.assertEqual((explanation["empty"], explanation["sql"]), (True, None))
+
+    def test_cache_key(self):
+        other_user = mommy.make(settings.AUTH_USER_MODEL)
+        for user in [self.user, other_user]:
+            mommy.make("django_ranger.UserGrant", user=user,
+                       permission=self.can_view_permission_with_param,
+                       parameter_values={'active': True})
+
+        action_list = [(self.can_view_with_param_code, {'active': 'is_active'})]
+        user_model = self.user._meta.model
+
+        queryset = RangerQuerySet(user_model, PermissionManager(self.user), action_list).filter(pk__gt=0)
+        other_queryset = RangerQuerySet(user_model, PermissionManager(other_user), action_list).filter(pk__gt=0)
+        self.assertEqual(queryset.cache_key(), other_queryset.cache_key())
+        self.assertNotEqual(queryset.cache_key(), queryset.filter(pk__gt=1).cache_key())
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.template import Context, Engine
+from django.test import TestCase
+from django.test.client import RequestFactory
+from model_mommy import mommy
+
+from ..context_processors import permissions
+
+
+class TemplateTagsTestCase(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(settings.AUTH_USER_MODEL)
+        self.can_manage_code = "can_manage:module"
+        self.can_manage_permission = mommy.make("django_ranger.Permission",
+                                                code=self.can_manage_code,
+                                                parameters_definition=["module_id"])
+        mommy.make("django_ranger.UserGrant", user=self.user,
+                   permission=self.can_manage_permission,
+                   parameter_values={"module_id": 1})
+        self.request = RequestFactory().get("/url/")
+        self.request.user = self.user
+
+    def render(self, template, **context):
+        context.update(permissions(self.request))
+        engine = Engine(libraries={"ranger": "django_ranger.templatetags.ranger"})
+        return engine.from_string("{% load ranger %}" + template).render(Context(context)).strip()
+
+    def test_ranger_has_perm(self):
+        response = self.render(
+            '{% for module_id in ids %}{% ranger_has_perm code module_id=module_id as allowed %}'
+            '{{ module_id }}:{{ allowed }} {% endfor %}',
+            ids=[1, 2], code=self.can_manage_code,
+        )
+        self.assertEqual(response, "1:True 2:False")
+
+    def test_ranger_allowed(self):
+        template = '{% for module_id in ids %}{% ranger_allowed "can_manage:module" module_id=module_id %}' \
+                   'edit{% else %}view{% endranger_allowed %} {% endfor %}'
+        self.render(template, ids=[1])
+
+        with self.assertNumQueries(0):
+            response = self.render(template, ids=list(range(1, 201)))
+        self.assertEqual(response.split(), ["edit"] + ["view"] * 199)
+
+    def test_ranger_allowed_anonymous_user(self):
+        self.request.user = AnonymousUser()
+
+        response = self.render('{% ranger_allowed "can_manage:module" module_id=1 %}edit{% endranger_allowed %}')
+        self.assertEqual(response, "")
@@ -0,0 +1,75 @@
+import time
+import uuid
+from unittest import mock
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from model_mommy import mommy
+
+from ..exceptions import InvalidSnapshot
+from ..services import PermissionManager
+from ..tokens import GrantSnapshot, dumps_grants
+
+
+class GrantSnapshotTestCase(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(settings.AUTH_USER_MODEL)
+        self.group = mommy.make("auth.Group")
+        self.user.groups.add(self.group)
+        self.can_view_code = "can_view:module"
+        self.can_manage_code = "can_manage:module"
+        self.can_view_permission = mommy.make("django_ranger.Permission", code=self.can_view_code)
+        self.can_manage_permission = mommy.make("django_ranger.Permission",
+                                                code=self.can_manage_code,
+                                                parameters_definition=["module_id"],
+                                                parameter_types={"module_id": "int"})
+        mommy.make("django_ranger.UserGrant", user=self.user, permission=self.can_view_permission)
+        mommy.make("django_ranger.GroupGrant", group=self.group,
+                   permission=self.can_manage_permission,
+                   parameter_values={"module_id": 1})
+
+    def test_snapshot_has_permission(self):
+        token = dumps_grants(PermissionManager(self.user), key="secret")
+
+        snapshot = GrantSnapshot.loads(token, key="secret")
+        self.assertEqual(snapshot.user_id, str(self.user.pk))
+        self.assertTrue(snapshot.has_permission(self.can_view_code))
+        self.assertTrue(snapshot.has_permission(self.can_view_code, module_id=2))
+        self.assertTrue(snapshot.has_permission(self.can_manage_code, module_id="1"))
+        self.assertFalse(snapshot.has_permission(self.can_manage_code, module_id=2))
+        self.assertTrue(snapshot.has_any_permission([(self.can_manage_code, {"module_id": 2}),
+                                                     (self.can_manage_code, {"module_id": 1})]))
+
+    def test_snapshot_of_uuid_primary_key(self):
+        user = self.user.__class__(pk=uuid.uuid4())
+        user_permission = mock.Mock(user=user, get_grants=mock.Mock(return_value=[]))
+
+        snapshot = GrantSnapshot.loads(dumps_grants(user_permission, key="secret"), key="secret")
+        self.assertEqual(snapshot.user_id, str(user.pk))
+
+    def test_snapshot_invalid_signature(self):
+        token = dumps_grants(PermissionManager(self.user), key="secret")
+
+        with self.assertRaises(InvalidSnapshot):
+            GrantSnapshot.loads(token, key="other")
+
+        with self.assertRaises(InvalidSnapshot):
+            GrantSnapshot.loads(token.replace("v1.", "v2."), key="secret")
+
+    def test_snapshot_expired(self):
+        token = dumps_grants(PermissionManager(self.user), key="secret", expires_in=10)
+
+        with self.assertRaises(InvalidSnapshot):
+            GrantSnapshot.loads(token, key="secret", now=time.time() + 20)
+
+    @override_settings(RANGER_SNAPSHOT_KEY="shared")
+    def test_snapshot_key_setting(self):
+        token = dumps_grants(PermissionManager(self.user))
+        self.assertTrue(GrantSnapshot.loads(token, key="shared").has_permission(self.can_view_code))
+
+    def test_snapshot_key_required(self):
+        # SECRET_KEY is never shared with the verifying services
+        with self.assertRaises(ImproperlyConfigured):
+            dumps_grants(PermissionManager(self.user))
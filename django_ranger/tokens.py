@@ -0,0 +1,142 @@
+"""
+Signed snapshots of the effective grants of a user.
+
+A snapshot is a compact token that other services can verify with the shared
+key and use to check permissions locally, without database access. This module
+only depends on the standard library and `django_ranger.parameters`, except
+for `dumps_grants`, which reads the grants of a PermissionManager.
+
+A token has the form `v1.<payload>.<signature>`, where the payload is the
+zlib-compressed JSON of the grants, and the signature is its HMAC-SHA256, both
+encoded as unpadded urlsafe base64.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import time
+import zlib
+
+from .exceptions import InvalidSnapshot, ParameterError
+from .parameters import EMPTY_PARAMETERS_HASH, hash_parameters, normalize_parameters
+
+TOKEN_VERSION = 'v1'
+DEFAULT_EXPIRES_IN = 300
+
+
+def dumps_grants(permission_manager, key=None, expires_in=DEFAULT_EXPIRES_IN):
+    """
+    Returns a signed token with the effective grants of the user of the given
+    PermissionManager, valid for `expires_in` seconds. The primary key of the
+    user is stored as a string, so any type of key can be serialized.
+
+    The key defaults to the RANGER_SNAPSHOT_KEY setting, which is shared with
+    the verifying services, so it must not be SECRET_KEY. It raises
+    ImproperlyConfigured when neither is given.
+    """
+    if key is None:
+        from django.conf import settings
+        from django.core.exceptions import ImproperlyConfigured
+
+        key = getattr(settings, 'RANGER_SNAPSHOT_KEY', None)
+        if not key:
+            raise ImproperlyConfigured('Grant snapshots need a key, set the RANGER_SNAPSHOT_KEY setting.')
+
+    grants = {}
+    parameter_types = {}
+    for grant in permission_manager.get_grants():
+        code = grant.permission.code
+        hashes = grants.setdefault(code, [])
+        if grant.parameters_hash not in hashes:
+            hashes.append(grant.parameters_hash)
+        if grant.permission.parameter_types:
+            parameter_types[code] = grant.permission.parameter_types
+
+    payload = {
+        'sub': str(permission_manager.user.pk),
+        'exp': int(time.time()) + expires_in,
+        'g': grants,
+        't': parameter_types,
+    }
+    data = zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+    message = TOKEN_VERSION + '.' + _encode(data)
+    return message + '.' + _encode(_sign(key, message))
+
+
+class GrantSnapshot(object):
+    """
+    The grants of a user read from a signed token, which answers permission
+    checks like PermissionManager does. Its `user_id` is the primary key of
+    the user as a string.
+    """
+
+    def __init__(self, user_id, expires_at, grants, parameter_types):
+        self.user_id = user_id
+        self.expires_at = expires_at
+        self.grants = {code: frozenset(hashes) for code, hashes in grants.items()}
+        self.parameter_types = parameter_types
+
+    @classmethod
+    def loads(cls, token, key, now=None):
+        """
+        Verifies the token and returns its GrantSnapshot. It raises InvalidSnapshot
+        when the token is malformed, tampered, expired or of an unknown version.
+        """
+        try:
+            version, payload, signature = token.split('.')
+        except (AttributeError, ValueError):
+            raise InvalidSnapshot('Malformed grant snapshot')
+
+        if version != TOKEN_VERSION:
+            raise InvalidSnapshot('Unknown grant snapshot version {}'.format(version))
+
+        try:
+            valid = hmac.compare_digest(_decode(signature), _sign(key, version + '.' + payload))
+            data = json.loads(zlib.decompress(_decode(payload)).decode('utf-8')) if valid else None
+        except (ValueError, zlib.error):
+            raise InvalidSnapshot('Malformed grant snapshot')
+
+        if not valid:
+            raise InvalidSnapshot('Invalid grant snapshot signature')
+
+        if data['exp'] < (time.time() if now is None else now):
+            raise InvalidSnapshot('Expired grant snapshot')
+
+        return cls(data['sub'], data['exp'], data['g'], data['t'])
+
+    def has_permission(self, action_name, **parameter_values):
+        granted_hashes = self.grants.get(action_name, ())
+        if EMPTY_PARAMETERS_HASH in granted_hashes:
+            return True
+
+        try:
+            parameter_values = normalize_parameters(self.parameter_types.get(action_name), parameter_values)
+        except ParameterError:
+            return False
+        return hash_parameters(parameter_values) in granted_hashes
+
+    def has_any_permission(self, action_list):
+        """
+        Receive a list of tuple's with their action_name and parameters values
+        e.g:
+        [('can_view:module', {'module_id': 1}), ('can_manage:module', {'module_id': 12})]
+        """
+        for action_name, parameter_values in action_list:
+            if self.has_permission(action_name, **parameter_values):
+                return True
+
+        return False
+
+
+def _sign(key, message):
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return hmac.new(key, message.encode('utf-8'), hashlib.sha256).digest()
+
+
+def _encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
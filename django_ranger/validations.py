@@ -1,6 +1,118 @@
-from collections import Counter
+from django.db import models, transaction
 
 from .exceptions import ParameterError
+from .parameters import hash_parameters, normalize_parameters
+
+
+def validate_parameters(permission, parameter_values):
+    """
+    Raises ParameterError when the given `parameter_values` are inconsistent
+    with the parameters defined in the permission.
+
+    Returns the parameter values normalized to the permission parameter types.
+    """
+    definition = sorted(permission.parameters_definition)
+    values = sorted(parameter_values.keys())
+    if definition != values and values != []:
+        msg = u"parameter_values content is inconsistent with permission.parameters_definition {}-{}".format(
+            definition, values)
+        raise ParameterError(msg)
+    return normalize_parameters(permission.parameter_types, parameter_values)
+
+
+def validate_grants(grants):
+    """
+    Validates a batch of UserGrant or GroupGrant instances like
+    ValidatingGrantModel does on save, loading their permissions with a single query.
+
+    The `parameter_values` of the grants are normalized and their `parameters_hash`
+    are set. It raises a ParameterError which reports every inconsistent grant at once.
+    """
+    if not grants:
+        return
+
+    permission_field = grants[0]._meta.get_field('permission')
+    missing_ids = {grant.permission_id for grant in grants if not permission_field.is_cached(grant)}
+    permissions = permission_field.related_model.objects.in_bulk(missing_ids) if missing_ids else {}
+
+    errors = []
+    for index, grant in enumerate(grants):
+        if not permission_field.is_cached(grant):
+            if grant.permission_id not in permissions:
+                errors.append(u"grant {}: permission {} does not exist".format(index, grant.permission_id))
+                continue
+            grant.permission = permissions[grant.permission_id]
+
+        try:
+            grant.parameter_values = validate_parameters(grant.permission, grant.parameter_values)
+        except ParameterError as error:
+            errors.append(u"grant {}: {}".format(index, error))
+            continue
+        grant.parameters_hash = hash_parameters(grant.parameter_values)
+
+    if errors:
+        raise ParameterError(u"\n".join(errors))
+
+
+class ValidatingGrantQuerySet(models.QuerySet):
+    """
+    A QuerySet for UserGrant and GroupGrant models that validates bulk writes.
+    """
+
+    def update(self, **kwargs):
+        """
+        Updates the grants, normalizing a new `parameter_values` to the types
+        of each permission and updating their `parameters_hash` with it.
+        The cached grants of their users or groups are invalidated, as
+        update sends no signal.
+        """
+        from .cache import invalidate_groups, invalidate_users, is_enabled
+
+        owner = 'user' if hasattr(self.model, 'user_id') else 'group'
+        owner_ids = set(self.values_list('%s_id' % owner, flat=True)) if is_enabled() else set()
+        new_owner = kwargs.get(owner, kwargs.get('%s_id' % owner))
+        if new_owner is not None and not hasattr(new_owner, 'resolve_expression'):
+            owner_ids.add(getattr(new_owner, 'pk', new_owner))
+
+        updated = self._update_grants(**kwargs)
+        if owner == 'user':
+            invalidate_users(owner_ids, using=self.db)
+        else:
+            invalidate_groups(owner_ids, using=self.db)
+        return updated
+
+    def _update_grants(self, **kwargs):
+        if 'parameter_values' not in kwargs or 'parameters_hash' in kwargs:
+            return super(ValidatingGrantQuerySet, self).update(**kwargs)
+
+        parameter_values = kwargs['parameter_values']
+        if hasattr(parameter_values, 'resolve_expression'):
+            raise ParameterError(u"parameter_values can not be updated with an expression, "
+                                 u"as their parameters_hash can not be computed")
+
+        permission_model = self.model._meta.get_field('permission').related_model
+        updated = 0
+        with transaction.atomic(using=self.db):
+            for permission in permission_model.objects.using(self.db).filter(pk__in=self.values('permission_id')):
+                normalized_values = validate_parameters(permission, parameter_values)
+                updated += super(ValidatingGrantQuerySet, self.filter(permission=permission)).update(**dict(
+                    kwargs, parameter_values=normalized_values, parameters_hash=hash_parameters(normalized_values)))
+        return updated
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Validates every grant with `validate_grants`, setting their `parameters_hash`,
+        and creates them. No grant is created when any of them is inconsistent.
+        """
+        from .cache import invalidate_groups, invalidate_users
+
+        objs = list(objs)
+        validate_grants(objs)
+        created = super(ValidatingGrantQuerySet, self).bulk_create(objs, *args, **kwargs)
+        # bulk_create sends no signal
+        invalidate_users({obj.user_id for obj in objs if hasattr(obj, 'user_id')}, using=self.db)
+        invalidate_groups({obj.group_id for obj in objs if hasattr(obj, 'group_id')}, using=self.db)
+        return created
 
 
 class ValidatingGrantModel(object):
@@ -8,7 +120,8 @@ class ValidatingGrantModel(object):
     A validation Mixin for  UserGrant and GroupGrant models.
 
     it verifies that the `parameter_values` of the grant instance be consistent
-    with the parameters defined in the permission instance.
+    with the parameters defined in the permission instance, and keeps their
+    `parameters_hash` up to date.
 
     """
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
@@ -18,10 +131,8 @@ class ValidatingGrantModel(object):
         if not hasattr(self, "parameter_values"):
             raise AttributeError(u"The model must have a parameter_values field")
 
-        definition = sorted(self.permission.parameters_definition)
-        values = sorted(self.parameter_values.keys())
-        if definition != values and values != []:
-            msg = u"parameter_values content is inconsistent with permission.parameters_definition {}-{}".format(
-                definition, values)
-            raise ParameterError(msg)
+        self.parameter_values = validate_parameters(self.permission, self.parameter_values)
+        self.parameters_hash = hash_parameters(self.parameter_values)
+        if update_fields is not None and 'parameter_values' in update_fields:
+            update_fields = set(update_fields) | {'parameters_hash'}
         super(ValidatingGrantModel, self).save(force_insert, force_update, using, update_fields)
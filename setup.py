@@ -10,7 +10,8 @@ os.chdir(os.path.normpath(os.path.join(os.path.abspath(__file__), os.pardir)))
 setup(
     name='django-ranger',
     version='0.4.4',
-    packages=['django_ranger', 'django_ranger.migrations'],
+    packages=['django_ranger', 'django_ranger.migrations', 'django_ranger.management',
+              'django_ranger.management.commands', 'django_ranger.templatetags'],
     include_package_data=True,
     license='BSD License',
     description='Parametrized Role Based Access Control (PRBAC) system',